@@ -0,0 +1,358 @@
+"""Asyncio HTTP API over the tracker's lookup core.
+
+    python api.py --host 127.0.0.1 --port 8600
+
+Endpoints (JSON unless noted):
+    GET  /lookup/ip/<ip>              one IP, same sources as track_ip()
+    GET  /lookup/phone/<number>       one phone number (?region=CH)
+    POST /lookup/ip/batch             {"ips": [...]}
+    POST /lookup/phone/batch          {"numbers": [...], "region": "CH"}
+    GET  /stats                       API, cache, upstream and stage metrics
+    GET  /metrics                     Prometheus text
+    GET  /health
+
+Offline-database and in-memory cache hits are answered on the event loop.
+Everything else (the SQLite cache tier, then ipinfo.io) runs on a bounded
+thread pool, and concurrent requests for the same IP and priority share one
+such call (single-flight).
+"""
+import argparse
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from bulk_lookup import normalize_ip
+from http_client import get_client
+from ip_lookup import lookup_ip, lookup_ip_local
+from lookup_cache import get_lookup_cache
+from metrics import timed
+from phone_batch import DEFAULT_REGION, analyze_number, analyze_numbers
+from quota import BULK, INTERACTIVE, get_scheduler
+
+
+UPSTREAM_CONCURRENCY = 16
+MAX_BATCH = 1000
+MAX_BODY = 1024 * 1024
+MAX_HEADER_LINES = 100
+KEEPALIVE_TIMEOUT = 30
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 502: 'Bad Gateway'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LookupService:
+    """IP and phone lookups with single-flight coalescing and bounded upstream calls"""
+
+    def __init__(self, upstream_concurrency=UPSTREAM_CONCURRENCY):
+        self.upstream_concurrency = upstream_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=upstream_concurrency, thread_name_prefix='upstream')
+        self._inflight = {}
+        self.stats = {
+            'requests': 0,
+            'local_hits': 0,
+            'upstream_calls': 0,
+            'coalesced': 0,
+            'upstream_inflight': 0,
+        }
+
+    async def lookup_ip(self, ip, priority=INTERACTIVE):
+        """Return (data, error) for a normalized IP"""
+        local = lookup_ip_local(ip, memory_only=True)
+        if local is not None:
+            self.stats['local_hits'] += 1
+            return local
+
+        # Keyed by priority too, so an interactive caller never waits on a
+        # bulk call that the bulk quota cap may defer
+        key = (ip, priority)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            # The shared task is never cancelled: a caller that disconnects only
+            # stops waiting, the others still get the result
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(loop.run_in_executor(self._executor, lookup_ip, ip, None, priority))
+            self._inflight[key] = task
+            self.stats['upstream_calls'] += 1
+            self.stats['upstream_inflight'] += 1
+            task.add_done_callback(lambda _: self._finish(key))
+        try:
+            return await asyncio.shield(task)
+        except Exception as e:
+            return None, f"Error fetching IP data: {str(e)}"
+
+    def _finish(self, key):
+        self.stats['upstream_inflight'] -= 1
+        del self._inflight[key]
+
+    async def lookup_ips(self, ips):
+        return await asyncio.gather(*(self.lookup_ip(ip, BULK) for ip in ips))
+
+    async def analyze_numbers(self, numbers, region):
+        # Large batches fan out to processes; keep the loop free meanwhile
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, analyze_numbers, numbers, region)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['upstream_concurrency'] = self.upstream_concurrency
+        stats['pending_keys'] = len(self._inflight)
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _ip_result(value, data, error):
+    return {'input': value, 'data': data, 'error': error}
+
+
+class LookupAPI:
+    """Minimal HTTP/1.1 keep-alive server routing requests to a LookupService"""
+
+    def __init__(self, service=None, max_batch=MAX_BATCH):
+        self.service = service or LookupService()
+        self.max_batch = max_batch
+        self.server = None
+        self._connections = set()
+
+    async def start(self, host='127.0.0.1', port=8600):
+        self.server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEPALIVE_TIMEOUT)
+                except HttpError as e:
+                    await self._respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    status, payload = await self._dispatch(method, target, body)
+                except HttpError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # shutdown() closing an idle keep-alive connection
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HttpError(400, 'Malformed request line')
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(400, 'Too many headers')
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, 'Invalid Content-Length')
+        if length > MAX_BODY:
+            raise HttpError(413, 'Request body too large')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip('/')
+        query = parse_qs(url.query)
+        self.service.stats['requests'] += 1
+
+        if path == '/lookup/ip/batch':
+            self._require(method, 'POST')
+            return await self._ip_batch(self._json(body).get('ips'))
+        if path == '/lookup/phone/batch':
+            self._require(method, 'POST')
+            request = self._json(body)
+            return await self._phone_batch(request.get('numbers'), request.get('region') or DEFAULT_REGION)
+        if path.startswith('/lookup/ip/'):
+            self._require(method, 'GET')
+            return await self._ip(unquote(path[len('/lookup/ip/'):]))
+        if path.startswith('/lookup/phone/'):
+            self._require(method, 'GET')
+            region = query.get('region', [DEFAULT_REGION])[0]
+            with timed('api.lookup_phone'):
+                return 200, analyze_number(unquote(path[len('/lookup/phone/'):]), region)
+        if path == '/stats':
+            return 200, {
+                'api': self.service.get_stats(),
+                'cache': get_lookup_cache().get_stats(),
+                'upstream': get_client().get_stats(),
+                'quota': get_scheduler().get_stats(),
+                'stages': metrics.snapshot(),
+            }
+        if path == '/metrics':
+            return 200, metrics.render_prometheus()
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        raise HttpError(404, f"No route for {path or '/'}")
+
+    def _require(self, method, expected):
+        if method != expected:
+            raise HttpError(405, f"Use {expected}")
+
+    def _json(self, body):
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            raise HttpError(400, 'Body must be JSON')
+        if not isinstance(request, dict):
+            raise HttpError(400, 'Body must be a JSON object')
+        return request
+
+    def _batch(self, values, name):
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise HttpError(400, f"'{name}' must be a list of strings")
+        if len(values) > self.max_batch:
+            raise HttpError(413, f"At most {self.max_batch} {name} per batch")
+        return values
+
+    async def _ip(self, value):
+        ip = normalize_ip(value)
+        if ip is None:
+            raise HttpError(400, 'Invalid IP address')
+        with timed('api.lookup_ip'):
+            data, error = await self.service.lookup_ip(ip)
+        return (502 if error else 200), _ip_result(value, data, error)
+
+    async def _ip_batch(self, values):
+        values = self._batch(values, 'ips')
+        ips = [normalize_ip(value) for value in values]
+        with timed('api.lookup_ip_batch'):
+            results = await self.service.lookup_ips(ip for ip in ips if ip is not None)
+        results = iter(results)
+        return 200, {'results': [
+            _ip_result(value, *next(results)) if ip is not None else _ip_result(value, None, 'Invalid IP address')
+            for value, ip in zip(values, ips)
+        ]}
+
+    async def _phone_batch(self, numbers, region):
+        numbers = self._batch(numbers, 'numbers')
+        with timed('api.lookup_phone_batch'):
+            results = await self.service.analyze_numbers(numbers, region)
+        return 200, {'results': results}
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.service.close()
+
+    async def shutdown(self):
+        """Close the listener and cancel this server's open keep-alive connections"""
+        self.close()
+        tasks = list(self._connections)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class BackgroundAPI:
+    """Run a LookupAPI on its own event loop thread; for embedding and benchmarks"""
+
+    def __init__(self, host='127.0.0.1', port=0, **kwargs):
+        self.host = host
+        self.api = LookupAPI(LookupService(**kwargs))
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='lookup-api', daemon=True)
+        self._port = port
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.api.port}'
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.api.start(self.host, self._port), self.loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.api.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+async def serve(host, port, upstream_concurrency):
+    api = LookupAPI(LookupService(upstream_concurrency))
+    server = await api.start(host, port)
+    print(f"Lookup API listening on http://{host}:{api.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        api.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--upstream-concurrency', type=int, default=UPSTREAM_CONCURRENCY)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.upstream_concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
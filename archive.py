@@ -0,0 +1,437 @@
+"""Tiered retention: move old search history into compressed Parquet partitions.
+
+    python archive.py run [--days 90] [--db tracker_data.db] [--archive-dir archive]
+    python archive.py vacuum
+    python archive.py stats
+
+Rows older than the retention age are written to
+<archive-dir>/<table>/month=YYYY-MM/part-<first id>-<last id>.parquet (zstd),
+their counts are recorded in archive_rollups, and they are deleted from SQLite.
+The database is then vacuumed, unless the app holds it busy; rerun with
+--no-vacuum or while the app is idle in that case. The live rollups keep
+counting archived rows, and the history browser continues into the archive
+once the live rows run out, so nothing disappears from the app.
+Each run touches <archive-dir>/LAST_RUN, which invalidates the app's cached
+statistics and history pages (see persistence.get_data_version).
+
+Each file is recorded in archive_files in the same transaction that deletes
+its rows; files without a record (from an interrupted run) are removed on the
+next run, so a crash never leaves rows in both tiers.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+from geo_bins import cell_sql
+from ip_storage import cidr_range
+from rollups import SEARCH_TABLES, add_rollup_counts
+
+
+DB_PATH = 'tracker_data.db'
+ARCHIVE_DIR = os.environ.get('GEONET_ARCHIVE_DIR', 'archive')
+RETENTION_DAYS = int(os.environ.get('GEONET_RETENTION_DAYS', 90))
+# Rows per Parquet file; bounds memory while archiving
+CHUNK_ROWS = 200000
+# Rows per row group; a history page reads only the row groups it needs
+ROW_GROUP_ROWS = 10000
+COMPRESSION = 'zstd'
+STAMP_FILE = 'LAST_RUN'
+
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive_files (
+        path TEXT PRIMARY KEY,
+        source_table TEXT NOT NULL,
+        month TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        min_timestamp TEXT,
+        max_timestamp TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+# Rollup name -> SQL key expression, per kind; mirrors the live rollup triggers
+ARCHIVE_ROLLUPS = {
+    'Phone': {
+        'total': "''",
+        'country': "IFNULL(country, '')",
+        'day': "IFNULL(date(timestamp), '')",
+    },
+    'IP': {
+        'total': "''",
+        'country': "IFNULL(country, '')",
+        'day': "IFNULL(date(timestamp), '')",
+        'prefix': 'ip_prefix',
+        'asn': 'asn',
+        'geo': f"CASE WHEN latitude IS NOT NULL AND longitude IS NOT NULL THEN {cell_sql('ip_searches')} END",
+    },
+}
+
+# History view column -> archive column, per kind (see history.SOURCES)
+HISTORY_SOURCES = {
+    'Phone': {'search_term': 'phone_number', 'region': None, 'city': None, 'isp': 'detected_operator'},
+    'IP': {'search_term': 'searched_ip', 'region': 'region', 'city': 'city', 'isp': 'isp'},
+}
+
+
+def ensure_archive_tables(conn):
+    conn.executescript(ARCHIVE_SCHEMA)
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _remove_orphans(conn, archive_dir):
+    """Delete Parquet files an interrupted run wrote but never recorded"""
+    recorded = {row[0] for row in conn.execute('SELECT path FROM archive_files')}
+    removed = 0
+    for root, _, files in os.walk(archive_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(('.parquet', '.tmp')) and os.path.relpath(path, archive_dir) not in recorded:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def _archive_chunk(conn, kind, table, columns, month, start, end, archive_dir, chunk_rows):
+    """Move up to chunk_rows rows of one month to Parquet; returns rows moved"""
+    import pandas as pd
+
+    rows = conn.execute(f'''
+        SELECT {', '.join(columns)} FROM {table}
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY id
+        LIMIT ?
+    ''', (start, end, chunk_rows)).fetchall()
+    if not rows:
+        return 0
+
+    frame = pd.DataFrame.from_records(rows, columns=columns)
+    first_id, last_id = int(frame['id'].iloc[0]), int(frame['id'].iloc[-1])
+    relative = os.path.join(table, f'month={month}', f'part-{first_id:012d}-{last_id:012d}.parquet')
+    path = os.path.join(archive_dir, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_parquet(path + '.tmp', compression=COMPRESSION, index=False, row_group_size=ROW_GROUP_ROWS)
+    os.replace(path + '.tmp', path)
+
+    # The selected rows are exactly those in the window with id <= last_id
+    where = 'timestamp >= ? AND timestamp < ? AND id <= ?'
+    params = (start, end, last_id)
+    with conn:
+        counts = {}
+        for rollup, key in ARCHIVE_ROLLUPS[kind].items():
+            counts[rollup] = [(kind, k, n) for k, n in conn.execute(f'''
+                SELECT {key} AS k, COUNT(*) FROM {table} WHERE {where} GROUP BY k HAVING k IS NOT NULL
+            ''', params)]
+            conn.executemany('''
+                INSERT INTO archive_rollups (rollup, search_kind, key, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (rollup, search_kind, key) DO UPDATE SET count = count + excluded.count
+            ''', [(rollup,) + row for row in counts[rollup]])
+        conn.execute(f'DELETE FROM {table} WHERE {where}', params)
+        # Put back what the delete triggers took, so top-N reads stay on the count indexes
+        for rollup, archived in counts.items():
+            add_rollup_counts(conn, rollup, archived)
+        conn.execute('''
+            INSERT INTO archive_files (path, source_table, month, rows, min_timestamp, max_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (relative, table, month, len(rows), frame['timestamp'].min(), frame['timestamp'].max()))
+    return len(rows)
+
+
+def archive_old_rows(conn, days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, chunk_rows=CHUNK_ROWS):
+    """Archive rows older than `days`; returns {table: rows moved}"""
+    # Imported here: persistence imports this module through history
+    from persistence import bump_data_version, init_schema
+
+    # A database the upgraded app hasn't opened yet lacks the archive_rollups
+    # table and the network columns the rollups are keyed on
+    init_schema(conn)
+    _remove_orphans(conn, archive_dir)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    moved = {}
+    for kind, table in SEARCH_TABLES.items():
+        columns = _table_columns(conn, table)
+        moved[table] = 0
+        months = [row[0] for row in conn.execute(f'''
+            SELECT DISTINCT substr(timestamp, 1, 7) FROM {table} WHERE timestamp < ? ORDER BY 1
+        ''', (cutoff,))]
+        for month in months:
+            year, number = int(month[:4]), int(month[5:7])
+            next_month = f'{year + number // 12:04d}-{number % 12 + 1:02d}'
+            start, end = month, min(next_month, cutoff)
+            while True:
+                count = _archive_chunk(conn, kind, table, columns, month, start, end, archive_dir, chunk_rows)
+                moved[table] += count
+                if count < chunk_rows:
+                    break
+
+    if any(moved.values()):
+        touch_stamp(archive_dir)
+        bump_data_version()
+    return moved
+
+
+def vacuum_database(conn):
+    """Reclaim the space archived rows left behind; returns an error message if the database was busy"""
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('VACUUM')
+    except sqlite3.OperationalError as e:
+        if 'locked' not in str(e) and 'busy' not in str(e):
+            raise
+        return str(e)
+    return None
+
+
+def touch_stamp(archive_dir=ARCHIVE_DIR):
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, STAMP_FILE), 'w') as stamp:
+        stamp.write(datetime.now(timezone.utc).isoformat())
+
+
+def get_archive_stamp(archive_dir=ARCHIVE_DIR):
+    """Changes whenever an archive run moves rows; 0 if there is no archive"""
+    try:
+        return os.stat(os.path.join(archive_dir, STAMP_FILE)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def has_archive(kind, archive_dir=ARCHIVE_DIR):
+    return os.path.isdir(os.path.join(archive_dir, SEARCH_TABLES[kind]))
+
+
+def _months_desc(table, archive_dir):
+    """[(month, [parquet paths])] for a table's partitions, newest month first"""
+    base = os.path.join(archive_dir, table)
+    partitions = []
+    for name in sorted(os.listdir(base), reverse=True):
+        if not name.startswith('month='):
+            continue
+        directory = os.path.join(base, name)
+        files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet'))
+        if files:
+            partitions.append((name[len('month='):], files))
+    return partitions
+
+
+def _row_filter(kind, source, filters, cursor, cidr):
+    """pyarrow expression for the history filters and keyset cursor, or False if no row can match"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    timestamp = pc.field('timestamp')
+    conditions = []
+    if filters.get('country'):
+        conditions.append(pc.field('country') == filters['country'])
+    if filters.get('isp'):
+        conditions.append(pc.match_substring(pc.field(source['isp']), filters['isp'], ignore_case=True))
+    if filters.get('start'):
+        conditions.append(timestamp >= filters['start'])
+    if filters.get('end'):
+        conditions.append(timestamp < filters['end'])
+    if filters.get('term'):
+        conditions.append(pc.starts_with(pc.field(source['search_term']), filters['term']))
+    if cidr:
+        if kind != 'IP':
+            return False
+        low, high = cidr
+        conditions.append((pc.field('ip_key') >= pa.scalar(low, pa.binary()))
+                          & (pc.field('ip_key') <= pa.scalar(high, pa.binary())))
+    if cursor is not None:
+        # Rows after the cursor in (timestamp, type, id) descending order
+        cursor_timestamp, cursor_kind, cursor_id = cursor
+        if kind == cursor_kind:
+            conditions.append((timestamp < cursor_timestamp)
+                              | ((timestamp == cursor_timestamp) & (pc.field('id') < cursor_id)))
+        elif kind < cursor_kind:
+            conditions.append(timestamp <= cursor_timestamp)
+        else:
+            conditions.append(timestamp < cursor_timestamp)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _column_range(row_group, index):
+    stats = row_group.column(index).statistics
+    if stats is None or not stats.has_min_max:
+        return None
+    return stats.min, stats.max
+
+
+def _candidate_row_groups(files, filters, cursor, cidr):
+    """[(max timestamp, path, row group)] whose statistics don't rule them out"""
+    import pyarrow.parquet as pq
+
+    groups = []
+    for path in files:
+        metadata = pq.ParquetFile(path).metadata
+        names = metadata.schema.names
+        for index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(index)
+            span = _column_range(row_group, names.index('timestamp'))
+            if span is None:
+                groups.append((None, path, index))
+                continue
+            oldest, newest = span
+            if cursor is not None and oldest > cursor[0]:
+                continue
+            if filters.get('start') and newest < filters['start']:
+                continue
+            if filters.get('end') and oldest >= filters['end']:
+                continue
+            if filters.get('country') and 'country' in names:
+                countries = _column_range(row_group, names.index('country'))
+                if countries and not countries[0] <= filters['country'] <= countries[1]:
+                    continue
+            if cidr and 'ip_key' in names:
+                keys = _column_range(row_group, names.index('ip_key'))
+                if keys and (keys[1] < cidr[0] or keys[0] > cidr[1]):
+                    continue
+            groups.append((newest, path, index))
+    # Newest first; groups without statistics can't be ordered, so they come first
+    unordered = [group for group in groups if group[0] is None]
+    ordered = sorted((group for group in groups if group[0] is not None), key=lambda group: group[0], reverse=True)
+    return unordered + ordered
+
+
+def fetch_archive_rows(kinds, cursor, limit, filters, archive_dir=ARCHIVE_DIR):
+    """Newest-first history rows from the archive, shaped like history.COLUMNS.
+
+    Filters and the cursor are pushed into pyarrow, row groups are skipped
+    on their statistics, and reading stops once `limit` rows per kind are
+    found that are newer than anything left unread.
+    """
+    import pyarrow.parquet as pq
+
+    cidr = cidr_range(filters['cidr']) if filters.get('cidr') else None
+    rows = []
+    for kind in kinds:
+        if not has_archive(kind, archive_dir):
+            continue
+        source = HISTORY_SOURCES[kind]
+        expression = _row_filter(kind, source, filters, cursor, cidr)
+        if expression is False:
+            continue
+        columns = list(dict.fromkeys(['id', 'timestamp', 'country'] + [column for column in source.values() if column]))
+        filter_columns = ['ip_key'] if cidr else []
+
+        found = []
+        for month, files in _months_desc(SEARCH_TABLES[kind], archive_dir):
+            if cursor is not None and month > cursor[0][:7]:
+                continue
+            if filters.get('start') and month < filters['start'][:7]:
+                break
+            if filters.get('end') and month > filters['end'][:7]:
+                continue
+            groups = _candidate_row_groups(files, filters, cursor, cidr)
+            for position, (_, path, index) in enumerate(groups):
+                table = pq.ParquetFile(path).read_row_group(index, columns=columns + filter_columns)
+                if expression is not None:
+                    table = table.filter(expression)
+                found.extend(
+                    (kind, row[source['search_term']], row['country'],
+                     row[source['region']] if source['region'] else None,
+                     row[source['city']] if source['city'] else None,
+                     row[source['isp']], row['timestamp'], int(row['id']))
+                    for row in table.select(columns).to_pylist()
+                )
+                found.sort(key=lambda row: (row[6], row[7]), reverse=True)
+                del found[limit:]
+                # Later groups are all older than their max timestamp
+                following = groups[position + 1][0] if position + 1 < len(groups) else None
+                if len(found) >= limit and following is not None and found[-1][6] > following:
+                    break
+            # Months are partitions of the timestamp, so older months hold older rows
+            if len(found) >= limit:
+                break
+        rows.extend(found)
+
+    rows.sort(key=lambda row: (row[6], row[0], row[7]), reverse=True)
+    return rows[:limit]
+
+
+def count_archive_in_cidr(cidr, archive_dir=ARCHIVE_DIR):
+    """Count archived IP searches inside a CIDR block.
+
+    Row groups whose ip_key range lies inside the block are counted from their
+    statistics; only those straddling its edges are read.
+    """
+    if not has_archive('IP', archive_dir):
+        return 0
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    low, high = cidr_range(cidr)
+    expression = (pc.field('ip_key') >= pa.scalar(low, pa.binary())) & (pc.field('ip_key') <= pa.scalar(high, pa.binary()))
+    total = 0
+    for _, files in _months_desc(SEARCH_TABLES['IP'], archive_dir):
+        for path in files:
+            parquet = pq.ParquetFile(path)
+            column = parquet.metadata.schema.names.index('ip_key')
+            for index in range(parquet.metadata.num_row_groups):
+                row_group = parquet.metadata.row_group(index)
+                keys = _column_range(row_group, column)
+                if keys is not None:
+                    if keys[1] < low or keys[0] > high:
+                        continue
+                    stats = row_group.column(column).statistics
+                    if low <= keys[0] and keys[1] <= high and stats.has_null_count:
+                        total += row_group.num_rows - stats.null_count
+                        continue
+                total += parquet.read_row_group(index, columns=['ip_key']).filter(expression).num_rows
+    return total
+
+
+def get_archive_stats(conn):
+    """Return per-table archived row counts, file counts and time span"""
+    return {
+        table: {'rows': rows, 'files': files, 'oldest': oldest, 'newest': newest}
+        for table, rows, files, oldest, newest in conn.execute('''
+            SELECT source_table, SUM(rows), COUNT(*), MIN(min_timestamp), MAX(max_timestamp)
+            FROM archive_files GROUP BY source_table
+        ''')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['run', 'vacuum', 'stats'])
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help='keep this many days in SQLite')
+    parser.add_argument('--no-vacuum', action='store_true')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    if args.command == 'run':
+        before = os.path.getsize(args.db)
+        moved = archive_old_rows(conn, args.days, args.archive_dir)
+        print(f"Archived {moved} to {args.archive_dir}")
+        if any(moved.values()) and not args.no_vacuum:
+            error = vacuum_database(conn)
+            if error:
+                print(f"Vacuum skipped ({error}); the rows are archived. Run `python archive.py vacuum` while the app is idle to reclaim space")
+            else:
+                print(f"{args.db}: {before:,} -> {os.path.getsize(args.db):,} bytes")
+    elif args.command == 'vacuum':
+        error = vacuum_database(conn)
+        print(f"Vacuum skipped ({error})" if error else f"Vacuumed {args.db}")
+    else:
+        ensure_archive_tables(conn)
+        for table, stats in get_archive_stats(conn).items():
+            print(f"{table}: {stats['rows']:,} rows in {stats['files']} file(s), {stats['oldest']} .. {stats['newest']}")
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""Offline benchmark suite for the tracker's hot paths.
+
+    python -m benchmarks.run --rows 10000 100000 1000000 --output results.json
+    python -m benchmarks.run --compare baseline.json results.json
+
+Everything runs against a local ipinfo/ipify stub and synthetic databases in a
+temporary directory; nothing touches the network or tracker_data.db. Results
+are written as JSON. --compare exits non-zero when a metric regressed by more
+than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic_history import generate
+
+
+def _latency(name, samples, **params):
+    samples_ms = sorted(sample * 1000 for sample in samples)
+    return {
+        'name': name,
+        'params': params,
+        'metric': 'latency_ms',
+        'value': round(statistics.median(samples_ms), 4),
+        'p95': round(samples_ms[int(len(samples_ms) * 0.95) - 1], 4),
+        'mean': round(statistics.fmean(samples_ms), 4),
+        'samples': len(samples_ms),
+    }
+
+
+def _throughput(name, operations, elapsed, **params):
+    return {
+        'name': name,
+        'params': params,
+        'metric': 'ops_per_sec',
+        'value': round(operations / elapsed, 1),
+        'operations': operations,
+        'elapsed_s': round(elapsed, 4),
+    }
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_lookups(latency_ms, repeat):
+    """track_ip() path: cold ipinfo lookups, memory/disk cache hits and bulk throughput"""
+    import ip_lookup
+    import lookup_cache
+    import quota
+    from bulk_lookup import iter_lookups
+    # Bare mode: Streamlit calls in track_ip() are no-ops outside `streamlit run`
+    from tracker import track_ip
+
+    results = []
+    with StubServer(latency_ms) as server:
+        ip_lookup.IPINFO_URL = server.ipinfo_url
+        ip_lookup.IPIFY_URL = server.ipify_url
+        cache = lookup_cache.get_lookup_cache()
+
+        ips = iter(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(1, 10 ** 7))
+        cold_ips = [next(ips) for _ in range(repeat)]
+        cold_iter = iter(cold_ips)
+        results.append(_latency('lookup_cold', _time(lambda: track_ip(next(cold_iter)), repeat),
+                                upstream_latency_ms=latency_ms))
+        results.append(_latency('lookup_memory_hit', _time(lambda: track_ip(cold_ips[0]), repeat * 10)))
+
+        # Drop the memory tier so the same addresses are served from SQLite
+        cache.clear_memory()
+        warm_iter = iter(cold_ips)
+        results.append(_latency('lookup_disk_hit', _time(lambda: track_ip(next(warm_iter)), repeat)))
+
+        results.append(_latency('get_user_ip', _time(ip_lookup.get_user_ip, repeat), upstream_latency_ms=latency_ms))
+
+        for concurrency in (1, 8, 16):
+            batch = [next(ips) for _ in range(repeat * 2)]
+            start = time.perf_counter()
+            # Same call the tracker's bulk tab makes
+            for _ in iter_lookups(batch, partial(ip_lookup.lookup_ip, priority=quota.BULK), concurrency):
+                pass
+            results.append(_throughput('bulk_lookup', len(batch), time.perf_counter() - start,
+                                       concurrency=concurrency, upstream_latency_ms=latency_ms))
+    return results
+
+
+async def _drive_api(port, targets, connections):
+    """Send GET requests for targets over keep-alive connections; return latencies"""
+    import asyncio
+    queue = iter(targets)
+    latencies = []
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for target in queue:
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return latencies
+
+
+def bench_api(latency_ms, requests_count):
+    """Async lookup API: cached-IP throughput and single-flight coalescing of a cold IP"""
+    import asyncio
+    import ip_lookup
+    from api import BackgroundAPI
+
+    results = []
+    with StubServer(latency_ms) as upstream, BackgroundAPI() as server:
+        ip_lookup.IPINFO_URL = upstream.ipinfo_url
+        service = server.api.service
+        hot = [f"/lookup/ip/172.16.0.{i}" for i in range(1, 101)]
+        asyncio.run(_drive_api(server.api.port, hot, 16))
+
+        for connections in (1, 32):
+            targets = [hot[i % len(hot)] for i in range(requests_count)]
+            start = time.perf_counter()
+            asyncio.run(_drive_api(server.api.port, targets, connections))
+            results.append(_throughput('api_lookup_cached', requests_count, time.perf_counter() - start,
+                                       connections=connections))
+
+        calls_before = service.stats['upstream_calls']
+        burst = 200
+        start = time.perf_counter()
+        asyncio.run(_drive_api(server.api.port, ['/lookup/ip/172.17.0.1'] * burst, burst))
+        result = _throughput('api_coalesced_burst', burst, time.perf_counter() - start,
+                             upstream_latency_ms=latency_ms)
+        result['upstream_calls'] = service.stats['upstream_calls'] - calls_before
+        results.append(result)
+    return results
+
+
+def bench_history(db_path, rows, repeat):
+    """Save functions, analytics statistics and history paging against a synthetic DB"""
+    from persistence import SearchWriter
+    from rollups import get_daily_counts, get_top_countries, get_totals
+    from history import fetch_page
+    from ip_storage import count_in_cidr, get_top_asns, get_top_prefixes
+    from geo_bins import get_map_bins
+
+    results = []
+    conn = sqlite3.connect(db_path)
+
+    def statistics_query():
+        get_top_countries(conn, 'Phone')
+        get_top_countries(conn, 'IP')
+        get_totals(conn)
+        get_daily_counts(conn)
+
+    results.append(_latency('search_statistics', _time(statistics_query, repeat), rows=rows))
+
+    def legacy_statistics_query():
+        # The pre-rollup get_search_statistics() scans, kept as a reference point
+        conn.execute('SELECT country, COUNT(*) FROM phone_searches GROUP BY country ORDER BY 2 DESC LIMIT 10').fetchall()
+        conn.execute('SELECT country, COUNT(*) FROM ip_searches GROUP BY country ORDER BY 2 DESC LIMIT 10').fetchall()
+        conn.execute('SELECT COUNT(*) FROM phone_searches').fetchall()
+        conn.execute('SELECT COUNT(*) FROM ip_searches').fetchall()
+
+    results.append(_latency('legacy_search_statistics', _time(legacy_statistics_query, max(repeat // 10, 3)), rows=rows))
+
+    results.append(_latency('top_networks', _time(lambda: (get_top_prefixes(conn), get_top_asns(conn)), repeat),
+                            rows=rows))
+    results.append(_latency('cidr_count', _time(lambda: count_in_cidr(conn, '100.0.0.0/8'), repeat), rows=rows))
+
+    for zoom in (1, 4):
+        results.append(_latency('map_bins', _time(lambda: get_map_bins(conn, zoom), max(repeat // 5, 3)),
+                                rows=rows, zoom=zoom))
+
+    results.append(_latency('history_first_page', _time(lambda: fetch_page(conn), repeat), rows=rows))
+    country = conn.execute("SELECT country FROM ip_searches LIMIT 1").fetchone()[0]
+    results.append(_latency('history_country_page', _time(lambda: fetch_page(conn, ('IP',), country=country), repeat),
+                            rows=rows))
+    conn.close()
+
+    writer = SearchWriter(db_path)
+    row = ('198.51.100.7', 'US', 'California', 'Mountain View', 'AS15169 Google LLC', '37.4,-122.0', 'Custom IP', '203.0.113.10')
+    results.append(_latency('save_ip_search_enqueue', _time(lambda: writer.submit('ip_searches', row), repeat), rows=rows))
+    writer.flush()
+    # What an interactive save costs: the tracker blocks until the row is committed
+    results.append(_latency('save_ip_search_commit', _time(lambda: writer.submit('ip_searches', row).wait(), repeat),
+                            rows=rows))
+
+    batch = [row] * 20000
+    start = time.perf_counter()
+    writer.submit_many('ip_searches', batch)
+    writer.flush()
+    results.append(_throughput('save_ip_search_insert', len(batch), time.perf_counter() - start, rows=rows))
+    writer.close()
+    return results
+
+
+def bench_phone(count):
+    """Phone parsing: the single-number tab's double parse vs the batch analyzer"""
+    import random
+    import phonenumbers
+    from phonenumbers import carrier, geocoder
+    from phone_batch import analyze_numbers
+
+    rng = random.Random(0)
+    prefixes = ['+9198', '+9170', '+1415', '+1212', '+4915', '+4477', '+5511', '+8190']
+    numbers = [f"{rng.choice(prefixes)}{rng.randint(10 ** 7, 10 ** 8 - 1)}" for _ in range(count)]
+
+    start = time.perf_counter()
+    for number in numbers:
+        geocoder.description_for_number(phonenumbers.parse(number, "CH"), "en")
+        carrier.name_for_number(phonenumbers.parse(number, "RO"), "en")
+    single = _throughput('phone_single_path', count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    analyze_numbers(numbers, workers=1)
+    batch_serial = _throughput('phone_batch', count, time.perf_counter() - start, workers=1)
+
+    start = time.perf_counter()
+    analyze_numbers(numbers)
+    batch_parallel = _throughput('phone_batch_parallel', count, time.perf_counter() - start, workers=os.cpu_count())
+    return [single, batch_serial, batch_parallel]
+
+
+COLD_IMPORT = '''
+import time
+import streamlit
+start = time.perf_counter()
+import tracker
+print(time.perf_counter() - start)
+'''
+
+
+def bench_cold_start(repeat):
+    """Fresh-process import of tracker.py, excluding streamlit (the server has it loaded)"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', COLD_IMPORT], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(float(output.split()[-1]))
+    return [_latency('tracker_cold_import', samples)]
+
+
+def run(rows_list, latency_ms, repeat, phone_count):
+    import lookup_cache
+    import quota
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='geonet-bench-')
+    cwd = os.getcwd()
+    # Module-level caches default to ./tracker_data.db, so keep them inside the scratch dir
+    os.chdir(workdir)
+    # Absolute paths, so nothing written after run() returns can reach the caller's database;
+    # the limits measure the lookup path itself, not the ipinfo.io rate limit
+    scratch_db = os.path.join(workdir, 'tracker_data.db')
+    quota.reset_scheduler(db_path=scratch_db, monthly_quota=10 ** 9, rate=10 ** 6, burst=10 ** 6)
+    lookup_cache.reset_lookup_cache(db_path=scratch_db)
+    try:
+        results.extend(bench_lookups(latency_ms, repeat))
+        results.extend(bench_api(latency_ms, repeat * 100))
+        for rows in rows_list:
+            db_path = os.path.join(workdir, f'history_{rows}.db')
+            start = time.perf_counter()
+            generate(db_path, rows)
+            print(f"  generated {rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            results.extend(bench_history(db_path, rows, repeat))
+            os.remove(db_path)
+        results.extend(bench_phone(phone_count))
+        results.extend(bench_cold_start(max(repeat // 10, 3)))
+    finally:
+        quota.reset_scheduler()
+        lookup_cache.reset_lookup_cache()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _result_key(result):
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+
+def compare(baseline_path, current_path, tolerance):
+    """Print per-metric changes; return the number of regressions beyond tolerance"""
+    with open(baseline_path) as f:
+        baseline = {_result_key(r): r for r in json.load(f)['results']}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    for result in current:
+        before = baseline.get(_result_key(result))
+        if before is None or not before['value']:
+            continue
+        change = (result['value'] - before['value']) / before['value']
+        # Latency regresses upwards, throughput downwards
+        worse = change > tolerance if result['metric'] == 'latency_ms' else change < -tolerance
+        regressions += worse
+        print(f"{'REGRESSION' if worse else 'ok':>10}  {_result_key(result):<70} "
+              f"{before['value']:>12} -> {result['value']:>12} {result['metric']} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='synthetic history sizes to benchmark (e.g. 10000 1000000 10000000)')
+    parser.add_argument('--latency-ms', type=float, default=20, help='stub upstream latency')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--phone-count', type=int, default=20000)
+    parser.add_argument('--output', default='-', help='JSON output path, or - for stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'))
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative change before flagging')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.tolerance)
+        print(f"{regressions} regression(s)")
+        return 1 if regressions else 0
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sqlite': sqlite3.sqlite_version,
+            'upstream_latency_ms': args.latency_ms,
+        },
+        'results': run(args.rows, args.latency_ms, args.repeat, args.phone_count),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
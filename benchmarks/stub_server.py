@@ -0,0 +1,122 @@
+"""Local stand-in for ipinfo.io and ipify.org with configurable latency.
+
+    python -m benchmarks.stub_server --port 8765 --latency-ms 40
+
+Point the app at it with GEONET_IPINFO_URL=http://127.0.0.1:8765/{}/json and
+GEONET_IPIFY_URL=http://127.0.0.1:8765/?format=json.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+COUNTRIES = ['US', 'IN', 'DE', 'GB', 'BR', 'JP', 'AU', 'FR', 'CA', 'SG']
+CITIES = ['Springfield', 'Mumbai', 'Berlin', 'London', 'Sao Paulo', 'Tokyo', 'Sydney', 'Paris', 'Toronto', 'Singapore']
+CLIENT_IP = '203.0.113.10'
+
+
+def fake_ipinfo(ip):
+    """Deterministic ipinfo.io-shaped payload for an address"""
+    digest = hashlib.blake2b(ip.encode(), digest_size=8).digest()
+    index = digest[0] % len(COUNTRIES)
+    lat = (int.from_bytes(digest[1:4], 'big') / 0xFFFFFF) * 140 - 70
+    lon = (int.from_bytes(digest[4:7], 'big') / 0xFFFFFF) * 360 - 180
+    return {
+        'ip': ip,
+        'city': CITIES[index],
+        'region': f'Region {digest[7] % 20}',
+        'country': COUNTRIES[index],
+        'loc': f'{lat:.4f},{lon:.4f}',
+        'org': f'AS{64512 + digest[7]} Example Networks',
+        'postal': f'{digest[6] * 100:05d}',
+        'timezone': 'UTC',
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    # Send headers and body in one segment so Nagle/delayed-ACK don't add ~40ms
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split('?', 1)[0].strip('/')
+        if not path:
+            status, body = 200, {'ip': CLIENT_IP}
+        elif path.endswith('json'):
+            ip = path[:-len('json')].strip('/') or CLIENT_IP
+            if ip.startswith('bogus'):
+                status, body = 404, {'error': {'title': 'Wrong ip', 'message': 'Please provide a valid IP address'}}
+            else:
+                status, body = 200, fake_ipinfo(ip)
+        else:
+            status, body = 404, {'error': 'not found'}
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """Threaded stub server; use as a context manager or call start()/stop()"""
+
+    def __init__(self, latency_ms=0, port=0):
+        handler = type('Handler', (StubHandler,), {'latency': latency_ms / 1000})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def ipinfo_url(self):
+        return self.base_url + '/{}/json'
+
+    @property
+    def ipify_url(self):
+        return self.base_url + '/?format=json'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+    server = StubServer(args.latency_ms, args.port)
+    print(f"Serving ipinfo/ipify stub on {server.base_url} ({args.latency_ms}ms latency)")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
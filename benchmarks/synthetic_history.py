@@ -0,0 +1,115 @@
+"""Generate a synthetic tracker database with realistic search history.
+
+    python -m benchmarks.synthetic_history bench.db --rows 1000000
+
+Rows are split evenly between phone_searches and ip_searches and spread over
+the last year. Rollups and indexes are built once after the bulk load, which
+is much faster than maintaining them row by row through the triggers.
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from persistence import SCHEMA
+from rollups import ensure_rollups
+from geo_bins import ensure_geo_bins
+from history import ensure_history_indexes
+from ip_storage import derive_columns, ensure_ip_storage
+from benchmarks.stub_server import fake_ipinfo
+
+
+CHUNK_SIZE = 50000
+PHONE_COUNTRIES = ['India', 'United States', 'Germany', 'United Kingdom', 'Brazil', 'Japan', 'Nigeria', 'France']
+OPERATORS = ['Airtel', 'Jio', 'Vi', 'Vodafone', 'T-Mobile', 'Orange', 'Claro', 'NTT Docomo', '']
+SEARCH_TYPES = ['Custom IP', 'Auto-Detect', 'Bulk']
+
+
+def _timestamps(rng, start, span_seconds):
+    while True:
+        yield (start + timedelta(seconds=rng.randrange(span_seconds))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _phone_rows(rng, count, timestamps):
+    for _ in range(count):
+        yield (
+            f"+{rng.choice((91, 1, 49, 44, 55, 81, 234, 33))}{rng.randint(10, 99)}***",
+            rng.choice(PHONE_COUNTRIES),
+            rng.choice(OPERATORS),
+            None,
+            f"198.51.100.{rng.randint(1, 254)}",
+            next(timestamps),
+        )
+
+
+def _ip_rows(rng, count, timestamps, distinct_ips):
+    for _ in range(count):
+        ip = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, distinct_ips // 65536 + 1)}.{rng.randint(1, 254)}"
+        data = fake_ipinfo(ip)
+        yield (
+            ip,
+            data['country'],
+            data['region'],
+            data['city'],
+            data['org'],
+            data['loc'],
+            rng.choice(SEARCH_TYPES),
+            f"198.51.100.{rng.randint(1, 254)}",
+            next(timestamps),
+        ) + derive_columns(ip, data['loc'], data['org'])
+
+
+def _insert_chunked(conn, sql, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            conn.executemany(sql, chunk)
+            chunk.clear()
+    if chunk:
+        conn.executemany(sql, chunk)
+
+
+def generate(db_path, rows, seed=0, days=365, distinct_ips=1000000):
+    """Create db_path with `rows` searches split between phone and IP history"""
+    rng = random.Random(seed)
+    timestamps = _timestamps(rng, datetime.utcnow() - timedelta(days=days), days * 86400)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.executescript(SCHEMA)
+    with conn:
+        _insert_chunked(conn, '''
+            INSERT INTO phone_searches (phone_number, country, detected_operator, manual_operator, user_ip, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', _phone_rows(rng, rows // 2, timestamps))
+        _insert_chunked(conn, '''
+            INSERT INTO ip_searches (searched_ip, country, region, city, isp, coordinates, search_type, user_ip, timestamp,
+                                     ip_key, ip_prefix, latitude, longitude, asn)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _ip_rows(rng, rows - rows // 2, timestamps, distinct_ips))
+
+    # Triggers are created (and the rollups backfilled) only after the bulk load
+    ensure_rollups(conn)
+    ensure_history_indexes(conn)
+    ensure_ip_storage(conn)
+    ensure_geo_bins(conn)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generate(args.db_path, args.rows, args.seed)
+    print(f"Wrote {args.rows} rows to {args.db_path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import csv
+import io
+import ipaddress
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+IP_COLUMN_NAMES = ('ip', 'ip_address', 'ipaddress', 'address', 'searched_ip')
+_SPLIT_PATTERN = re.compile(r'[\s,;]+')
+
+
+def normalize_ip(value):
+    """Return the canonical form of an IPv4/IPv6 address, or None if invalid"""
+    try:
+        return str(ipaddress.ip_address(value.strip()))
+    except ValueError:
+        return None
+
+
+def dedupe_ips(values):
+    """Validate and dedupe addresses, preserving first-seen order.
+
+    Returns a (valid, invalid) pair of lists.
+    """
+    seen = set()
+    valid = []
+    invalid = []
+    for value in values:
+        value = value.strip()
+        if not value:
+            continue
+        ip = normalize_ip(value)
+        if ip is None:
+            invalid.append(value)
+        elif ip not in seen:
+            seen.add(ip)
+            valid.append(ip)
+    return valid, invalid
+
+
+def parse_ip_list(text):
+    """Parse a pasted list of IPs separated by newlines, commas or spaces"""
+    return dedupe_ips(_SPLIT_PATTERN.split(text))
+
+
+def parse_ip_csv(text):
+    """Extract IPs from CSV text, using an IP-named header column if present"""
+    rows = csv.reader(io.StringIO(text))
+    header = next(rows, None)
+    if header is None:
+        return [], []
+
+    column = None
+    names = [name.strip().lower() for name in header]
+    for candidate in IP_COLUMN_NAMES:
+        if candidate in names:
+            column = names.index(candidate)
+            break
+
+    if column is None:
+        # No recognisable header: treat the first column as IPs, header row included
+        column = 0
+        values = [header[0]] if header else []
+    else:
+        values = []
+    values.extend(row[column] for row in rows if len(row) > column)
+    return dedupe_ips(values)
+
+
+def iter_lookups(ips, lookup, max_workers=8):
+    """Run lookup(ip) -> (data, error) over a bounded worker pool.
+
+    Yields (ip, data, error) in completion order so callers can stream
+    partial results. At most 2 * max_workers lookups are in flight, keeping
+    memory flat for arbitrarily long inputs.
+    """
+    ips = iter(ips)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for ip in ips:
+            pending[executor.submit(lookup, ip)] = ip
+            if len(pending) >= 2 * max_workers:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ip = pending.pop(future)
+                try:
+                    data, error = future.result()
+                except Exception as e:
+                    data, error = None, str(e)
+                yield ip, data, error
+
+            for ip in ips:
+                pending[executor.submit(lookup, ip)] = ip
+                if len(pending) >= 2 * max_workers:
+                    break
@@ -0,0 +1,247 @@
+"""Headless enrichment of IP addresses and phone numbers, streamed as JSONL or CSV.
+
+    python enrich.py ip access_ips.txt > enriched.jsonl
+    zcat extract.csv.gz | python enrich.py ip --column client_ip --format csv > out.csv
+    python enrich.py phone numbers.txt --region IN --save
+
+Input is read lazily from files (or stdin) and every stage is a generator, so
+memory stays flat however large the input is. Only the lookup/analysis core is
+imported here; nothing pulls in Streamlit or pandas.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from bulk_lookup import IP_COLUMN_NAMES, normalize_ip
+from ip_lookup import lookup_ip
+from quota import BULK
+from phone_batch import CHUNK_SIZE, DEFAULT_REGION, PHONE_COLUMN_NAMES, analyze_chunk, mask_number
+
+
+IP_FIELDS = ['input', 'ip', 'country', 'region', 'city', 'org', 'loc', 'postal', 'timezone', 'error']
+PHONE_FIELDS = ['phone_number', 'e164', 'valid', 'country', 'detected_operator', 'error']
+
+
+def read_lines(paths):
+    """Yield lines from each path in turn; '-' or no paths means stdin"""
+    for path in paths or ['-']:
+        if path == '-':
+            yield from sys.stdin
+        else:
+            with open(path, newline='') as f:
+                yield from f
+
+
+def iter_values(lines, column=None, names=()):
+    """Return an iterator of one stripped value per line, or one CSV column when column is given.
+
+    column may be a header name, a 0-based index, or 'auto' to pick the first
+    header found in names (falling back to the first column, header included).
+    The header is read up front, so an unknown column raises ValueError here
+    rather than once output has started.
+    """
+    if column is None:
+        return _line_values(lines)
+
+    rows = csv.reader(lines)
+    header = next(rows, None)
+    if header is None:
+        return iter(())
+    fields = [name.strip().lower() for name in header]
+    if column == 'auto':
+        index = next((fields.index(name) for name in names if name in fields), None)
+        if index is None:
+            index = 0
+            rows = _prepend(header, rows)
+    elif column.isdigit():
+        index = int(column)
+        rows = _prepend(header, rows)
+    elif column.lower() in fields:
+        index = fields.index(column.lower())
+    else:
+        raise ValueError(f"Column {column!r} not in header: {', '.join(header)}")
+    return _column_values(rows, index)
+
+
+def _line_values(lines):
+    for line in lines:
+        value = line.strip()
+        if value and not value.startswith('#'):
+            yield value
+
+
+def _column_values(rows, index):
+    for row in rows:
+        if len(row) > index and row[index].strip():
+            yield row[index].strip()
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+def _ip_record(value, future):
+    """Record for one input value; future is None for an invalid address"""
+    if future is None:
+        return {'input': value, 'error': 'Invalid IP address'}
+    try:
+        data, error = future.result()
+    except Exception as e:
+        data, error = None, str(e)
+    record = {'input': value}
+    if data:
+        record.update((field, data.get(field, '')) for field in IP_FIELDS[1:-1])
+    record['error'] = error or ''
+    return record
+
+
+def enrich_ips(values, workers=8, lookup=None):
+    """Yield one record per input value in input order, looking addresses up concurrently.
+
+    At most 2 * workers values are in flight, valid or not, so memory is
+    bounded however the input is mixed. Invalid addresses are reported with an
+    error instead of being looked up; repeats are served by the lookup cache.
+    """
+    lookup = lookup or (lambda ip: lookup_ip(ip, priority=BULK))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for value in values:
+            ip = normalize_ip(value)
+            pending.append((value, None) if ip is None else (ip, executor.submit(lookup, ip)))
+            while len(pending) >= 2 * workers or (pending and pending[0][1] is None):
+                yield _ip_record(*pending.popleft())
+        while pending:
+            yield _ip_record(*pending.popleft())
+
+
+def _chunks(values, size):
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def enrich_phones(values, default_region=DEFAULT_REGION, workers=None, chunk_size=CHUNK_SIZE):
+    """Yield analyze_number() records in input order, chunked across processes.
+
+    At most 2 * workers chunks are in flight, so memory is bounded by the chunk
+    size rather than the input size.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = ((chunk, default_region) for chunk in _chunks(values, chunk_size))
+    if workers == 1:
+        for args in chunks:
+            yield from analyze_chunk(args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for args in chunks:
+            pending.append(executor.submit(analyze_chunk, args))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def save_records(records, kind, writer, user_ip=None):
+    """Pass records through unchanged while queueing successful ones as search history"""
+    for record in records:
+        if record.get('error'):
+            pass
+        elif kind == 'ip':
+            writer.submit('ip_searches', (
+                record.get('ip', ''), record.get('country', ''), record.get('region', ''),
+                record.get('city', ''), record.get('org', ''), record.get('loc', ''),
+                'CLI', user_ip
+            ))
+        else:
+            writer.submit('phone_searches', (
+                mask_number(record['phone_number']), record['country'], record['detected_operator'],
+                None, user_ip
+            ))
+        yield record
+
+
+def write_jsonl(records, out):
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write('\n')
+        count += 1
+    return count
+
+
+def write_csv(records, out, fields):
+    writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('kind', choices=['ip', 'phone'])
+    parser.add_argument('inputs', nargs='*', help="input files (default: stdin, or '-')")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--column', help="read CSV input from this column: a header name, 0-based index or 'auto'")
+    parser.add_argument('--workers', type=int, help='concurrent IP lookups (default 8) or phone processes (default: CPUs)')
+    parser.add_argument('--region', default=DEFAULT_REGION, help='default region for phone numbers without +country code')
+    parser.add_argument('--save', action='store_true', help='also record successful lookups in the search history')
+    parser.add_argument('--db', default='tracker_data.db', help='database used by --save')
+    args = parser.parse_args(argv)
+
+    names = IP_COLUMN_NAMES if args.kind == 'ip' else PHONE_COLUMN_NAMES
+    try:
+        values = iter_values(read_lines(args.inputs), args.column, names)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if args.kind == 'ip':
+        records = enrich_ips(values, args.workers or 8)
+        fields = IP_FIELDS
+    else:
+        records = enrich_phones(values, args.region, args.workers)
+        fields = PHONE_FIELDS
+
+    writer = None
+    if args.save:
+        import sqlite3
+        from persistence import get_writer, init_schema
+        conn = sqlite3.connect(args.db)
+        init_schema(conn)
+        conn.close()
+        writer = get_writer(args.db)
+        records = save_records(records, args.kind, writer)
+
+    try:
+        if args.format == 'jsonl':
+            count = write_jsonl(records, sys.stdout)
+        else:
+            count = write_csv(records, sys.stdout, fields)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Downstream (e.g. head) closed early; silence the flush at interpreter exit
+        sys.stdout = open(os.devnull, 'w')
+        return 0
+    finally:
+        if writer is not None:
+            writer.flush()
+    print(f"Enriched {count} {args.kind} value(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
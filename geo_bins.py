@@ -0,0 +1,135 @@
+"""Spatially binned counts of IP search locations for the history map.
+
+A trigger-maintained rollup keeps one row per occupied fine grid cell
+(FINE_CELL degrees), so building a map never scans ip_searches. Coarser zoom
+levels merge fine cells with vectorized NumPy binning; the number of bins
+returned depends on where searches come from, not on how many there are.
+NumPy is imported on first use so schema setup at startup doesn't load it.
+"""
+from metrics import timed
+from rollups import restore_archived_counts
+
+
+# Finest cell size in degrees; zoom MAX_ZOOM uses it directly
+FINE_CELL = 0.125
+FINE_ROWS = int(180 / FINE_CELL)
+FINE_COLS = int(360 / FINE_CELL)
+MIN_ZOOM = 1
+MAX_ZOOM = 7
+MAX_BINS = 5000
+
+GEO_BIN_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS search_geo_bins (
+        cell INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS ip_searches_geo_insert AFTER INSERT ON ip_searches
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT INTO search_geo_bins (cell, count)
+            VALUES ({new_cell}, 1)
+            ON CONFLICT (cell) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS ip_searches_geo_delete AFTER DELETE ON ip_searches
+    WHEN OLD.latitude IS NOT NULL AND OLD.longitude IS NOT NULL
+    BEGIN
+        UPDATE search_geo_bins SET count = count - 1 WHERE cell = {old_cell};
+    END;
+'''
+
+
+def cell_sql(row):
+    """SQL expression for the fine cell id of a row alias (NEW, OLD or a table)"""
+    # Offsets make both operands non-negative, so CAST truncation is floor
+    lat_index = f'MIN(CAST(({row}.latitude + 90) / {FINE_CELL} AS INTEGER), {FINE_ROWS - 1})'
+    lon_index = f'MIN(CAST(({row}.longitude + 180) / {FINE_CELL} AS INTEGER), {FINE_COLS - 1})'
+    return f'({lat_index} * {FINE_COLS} + {lon_index})'
+
+
+def ensure_geo_bins(conn):
+    """Create the fine-cell rollup and its triggers, backfilling on first use"""
+    conn.executescript(GEO_BIN_SCHEMA.format(new_cell=cell_sql('NEW'), old_cell=cell_sql('OLD')))
+    if (conn.execute('SELECT 1 FROM search_geo_bins LIMIT 1').fetchone() is None
+            and conn.execute('SELECT 1 FROM ip_searches WHERE latitude IS NOT NULL LIMIT 1').fetchone()):
+        rebuild_geo_bins(conn)
+
+
+def rebuild_geo_bins(conn):
+    """Recompute the fine-cell counts from ip_searches"""
+    with conn:
+        conn.execute('DELETE FROM search_geo_bins')
+        conn.execute(f'''
+            INSERT INTO search_geo_bins (cell, count)
+            SELECT {cell_sql('ip_searches')} AS cell, COUNT(*) FROM ip_searches
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            GROUP BY cell
+        ''')
+        restore_archived_counts(conn, ('geo',))
+
+
+def cell_size(zoom):
+    """Bin edge in degrees for a map zoom level; each level halves the cell"""
+    zoom = min(max(int(zoom), MIN_ZOOM), MAX_ZOOM)
+    return FINE_CELL * 2 ** (MAX_ZOOM - zoom)
+
+
+def load_fine_bins(conn, bbox=None):
+    """Return (cell_ids, counts) arrays for occupied fine cells, limited to bbox's latitude band"""
+    import numpy as np
+
+    low, high = 0, FINE_ROWS * FINE_COLS - 1
+    if bbox is not None:
+        # Cell ids are row-major, so a latitude band is one primary key range
+        low = max(int((bbox[0] + 90) / FINE_CELL) - 1, 0) * FINE_COLS
+        high = (min(int((bbox[2] + 90) / FINE_CELL) + 1, FINE_ROWS - 1) + 1) * FINE_COLS - 1
+    rows = conn.execute(
+        'SELECT cell, count FROM search_geo_bins WHERE cell BETWEEN ? AND ? AND count > 0', (low, high)
+    ).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    bins = np.array(rows, dtype=np.int64)
+    return bins[:, 0], bins[:, 1]
+
+
+def coarsen(cells, counts, zoom, bbox=None, max_bins=MAX_BINS):
+    """Merge fine cells into the grid for a zoom level.
+
+    bbox is an optional (min_lat, min_lon, max_lat, max_lon) viewport. Returns
+    (latitudes, longitudes, counts) of bin centres, keeping the max_bins
+    fullest bins.
+    """
+    import numpy as np
+
+    shift = MAX_ZOOM - min(max(int(zoom), MIN_ZOOM), MAX_ZOOM)
+    size = FINE_CELL * 2 ** shift
+    rows, cols = np.divmod(cells, FINE_COLS)
+    rows >>= shift
+    cols >>= shift
+
+    lat = -90 + (rows + 0.5) * size
+    lon = -180 + (cols + 0.5) * size
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        inside = (lat >= min_lat - size) & (lat <= max_lat + size) & (lon >= min_lon - size) & (lon <= max_lon + size)
+        rows, cols, counts = rows[inside], cols[inside], counts[inside]
+
+    coarse_width = ((FINE_COLS - 1) >> shift) + 1
+    coarse = rows * coarse_width + cols
+    unique, inverse = np.unique(coarse, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts).astype(np.int64)
+    if len(unique) > max_bins:
+        keep = np.argpartition(totals, -max_bins)[-max_bins:]
+        unique, totals = unique[keep], totals[keep]
+
+    coarse_rows, coarse_cols = np.divmod(unique, coarse_width)
+    return -90 + (coarse_rows + 0.5) * size, -180 + (coarse_cols + 0.5) * size, totals
+
+
+def get_map_bins(conn, zoom, bbox=None, max_bins=MAX_BINS):
+    """Binned search locations for a zoom level as a list of (lat, lon, count)"""
+    with timed('geo.bins'):
+        cells, counts = load_fine_bins(conn, bbox)
+        lat, lon, totals = coarsen(cells, counts, zoom, bbox, max_bins)
+    return list(zip(lat.tolist(), lon.tolist(), totals.tolist()))
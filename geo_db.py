@@ -0,0 +1,211 @@
+"""Offline IP geolocation engine backed by a memory-mapped range database.
+
+Build the binary database from a CSV of IP ranges:
+
+    python geo_db.py build ranges.csv geo_ranges.bin
+
+The CSV needs either ``start_ip``/``end_ip`` columns or a ``network`` (CIDR)
+column, plus any of ``country``, ``region``, ``city``, ``org`` (or ``asn``),
+``loc`` (or ``latitude``/``longitude``), ``postal`` and ``timezone``.
+"""
+import csv
+import heapq
+import ipaddress
+import json
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+
+
+MAGIC = b'GEODB\x00\x01\x00'
+HEADER = struct.Struct('<8sIII12x')
+FIELDS = ('country', 'region', 'city', 'org', 'loc', 'postal', 'timezone')
+GEO_DB_PATH = os.environ.get('GEONET_GEO_DB', 'geo_ranges.bin')
+
+
+def _pack_v6(value):
+    return value.to_bytes(16, 'big')
+
+
+def _read_ranges(source_path):
+    """Yield (first_address, last_address, record) tuples from a range CSV"""
+    with open(source_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            if row.get('network'):
+                network = ipaddress.ip_network(row['network'], strict=False)
+                first, last = network.network_address, network.broadcast_address
+            else:
+                first = ipaddress.ip_address(row['start_ip'])
+                last = ipaddress.ip_address(row['end_ip'])
+            if first.version != last.version or int(first) > int(last):
+                continue
+
+            loc = row.get('loc')
+            if not loc and row.get('latitude') and row.get('longitude'):
+                loc = f"{row['latitude']},{row['longitude']}"
+            record = (
+                row.get('country', ''),
+                row.get('region', ''),
+                row.get('city', ''),
+                row.get('org') or row.get('asn', ''),
+                loc or '',
+                row.get('postal', ''),
+                row.get('timezone', ''),
+            )
+            yield first, last, record
+
+
+def _flatten(ranges):
+    """Resolve overlaps into disjoint ranges where the most specific range wins each address.
+
+    Returns (ranges, clipped), clipped being how many input ranges lost some
+    or all of their addresses to a more specific one.
+    """
+    ranges = sorted(ranges)
+    boundaries = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+    won = [0] * len(ranges)
+    active = []
+    flat = []
+    next_range = 0
+    # The active set is constant between consecutive boundaries
+    for point, next_point in zip(boundaries, boundaries[1:]):
+        while next_range < len(ranges) and ranges[next_range][0] <= point:
+            start, end, _ = ranges[next_range]
+            heapq.heappush(active, (end - start, start, next_range))
+            next_range += 1
+        while active and ranges[active[0][2]][1] < point:
+            heapq.heappop(active)
+        if not active:
+            continue
+        index = active[0][2]
+        record_id = ranges[index][2]
+        won[index] += next_point - point
+        if flat and flat[-1][2] == record_id and flat[-1][1] + 1 == point:
+            flat[-1] = (flat[-1][0], next_point - 1, record_id)
+        else:
+            flat.append((point, next_point - 1, record_id))
+    clipped = sum(1 for (start, end, _), count in zip(ranges, won) if count < end - start + 1)
+    return flat, clipped
+
+
+def build(source_path, output_path):
+    """Compile a range CSV into the binary format; returns (v4, v6, clipped)"""
+    records = []
+    record_ids = {}
+    v4 = []
+    v6 = []
+    for first, last, record in _read_ranges(source_path):
+        record_id = record_ids.get(record)
+        if record_id is None:
+            record_id = record_ids[record] = len(records)
+            records.append(record)
+        (v4 if first.version == 4 else v6).append((int(first), int(last), record_id))
+
+    # Binary search needs disjoint ranges; nested ones keep the outer range's remainder
+    v4, clipped_v4 = _flatten(v4)
+    v6, clipped_v6 = _flatten(v6)
+
+    records_blob = json.dumps(records, separators=(',', ':')).encode('utf-8')
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(v4), len(v6), len(records_blob)))
+        f.write(np.array([r[0] for r in v4], dtype='<u4').tobytes())
+        f.write(np.array([r[1] for r in v4], dtype='<u4').tobytes())
+        f.write(np.array([r[2] for r in v4], dtype='<u4').tobytes())
+        f.write(np.array([_pack_v6(r[0]) for r in v6], dtype='S16').tobytes())
+        f.write(np.array([_pack_v6(r[1]) for r in v6], dtype='S16').tobytes())
+        f.write(np.array([r[2] for r in v6], dtype='<u4').tobytes())
+        f.write(records_blob)
+    os.replace(tmp_path, output_path)
+    return len(v4), len(v6), clipped_v4 + clipped_v6
+
+
+class GeoDatabase:
+    """Read-only range database answering lookups by binary search over mmapped arrays"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, n4, n6, records_len = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a geo range database")
+
+        offset = HEADER.size
+        data = np.memmap(path, dtype='u1', mode='r')
+
+        def section(dtype, count):
+            nonlocal offset
+            size = np.dtype(dtype).itemsize * count
+            array = data[offset:offset + size].view(dtype)
+            offset += size
+            return array
+
+        self.v4_start = section('<u4', n4)
+        self.v4_end = section('<u4', n4)
+        self.v4_record = section('<u4', n4)
+        self.v6_start = section('S16', n6)
+        self.v6_end = section('S16', n6)
+        self.v6_record = section('<u4', n6)
+        self.records = json.loads(bytes(data[offset:offset + records_len]).decode('utf-8'))
+
+    def __len__(self):
+        return len(self.v4_start) + len(self.v6_start)
+
+    def lookup(self, ip_address):
+        """Return an ipinfo-shaped dict for ip_address, or None if it isn't covered"""
+        try:
+            address = ipaddress.ip_address(ip_address.strip())
+        except (AttributeError, ValueError):
+            return None
+
+        if address.version == 4:
+            starts, ends, record_ids, key = self.v4_start, self.v4_end, self.v4_record, int(address)
+        else:
+            starts, ends, record_ids, key = self.v6_start, self.v6_end, self.v6_record, _pack_v6(int(address))
+
+        index = int(np.searchsorted(starts, key, side='right')) - 1
+        if index < 0:
+            return None
+        end = ends[index]
+        if address.version == 6:
+            # numpy drops trailing NUL bytes from S16 scalars, so compare as integers
+            end = int.from_bytes(bytes(end).ljust(16, b'\x00'), 'big')
+        if int(end) < int(address):
+            return None
+
+        data = {'ip': str(address)}
+        data.update(zip(FIELDS, self.records[int(record_ids[index])]))
+        return data
+
+
+_geo_db = None
+_geo_db_loaded = False
+_geo_db_lock = threading.Lock()
+
+
+def get_geo_db(path=GEO_DB_PATH):
+    """Return the shared offline database, or None if no database file is installed"""
+    global _geo_db, _geo_db_loaded
+    with _geo_db_lock:
+        if not _geo_db_loaded:
+            _geo_db_loaded = True
+            if os.path.exists(path):
+                _geo_db = GeoDatabase(path)
+        return _geo_db
+
+
+def main(argv):
+    if len(argv) != 4 or argv[1] != 'build':
+        print("usage: python geo_db.py build <source.csv> <output.bin>", file=sys.stderr)
+        return 2
+    v4, v6, clipped = build(argv[2], argv[3])
+    print(f"Wrote {argv[3]}: {v4} IPv4 ranges, {v6} IPv6 ranges ({clipped} overlapping ranges clipped)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
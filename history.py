@@ -0,0 +1,123 @@
+"""Filterable search history with keyset pagination.
+
+Pages are ordered newest first by (timestamp, type, id). Each page is fetched
+with a cursor taken from the last row of the previous page, so every page is an
+index range scan of at most page_size rows per table, no matter how deep it is.
+Once the live rows run out, paging continues into the Parquet archive.
+"""
+from archive import fetch_archive_rows, has_archive
+from ip_storage import cidr_range
+from rollups import SEARCH_TABLES
+
+
+PAGE_SIZE = 50
+COLUMNS = ['type', 'search_term', 'country', 'region', 'city', 'isp', 'timestamp', 'id']
+
+# Per-kind column mapping onto the combined history view
+SOURCES = {
+    'Phone': {'term': 'phone_number', 'region': 'NULL', 'city': 'NULL', 'isp': 'detected_operator'},
+    'IP': {'term': 'searched_ip', 'region': 'region', 'city': 'city', 'isp': 'isp'},
+}
+
+INDEX_SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_phone_searches_phone_number ON phone_searches (phone_number);
+    CREATE INDEX IF NOT EXISTS idx_ip_searches_searched_ip ON ip_searches (searched_ip);
+'''
+
+
+def ensure_history_indexes(conn):
+    """Create the search-term indexes used by prefix filters"""
+    conn.executescript(INDEX_SCHEMA)
+
+
+def _kind_query(kind, filters, cursor, page_size):
+    """Build one newest-first, keyset-bounded SELECT for a single history table"""
+    source = SOURCES[kind]
+    where = []
+    params = []
+
+    if filters.get('country'):
+        where.append('country = ?')
+        params.append(filters['country'])
+    if filters.get('isp'):
+        where.append(f"{source['isp']} LIKE ?")
+        params.append(f"%{filters['isp']}%")
+    if filters.get('start'):
+        where.append('timestamp >= ?')
+        params.append(filters['start'])
+    if filters.get('end'):
+        where.append('timestamp < ?')
+        params.append(filters['end'])
+    if filters.get('cidr'):
+        if kind == 'IP':
+            # Key range over the encoded address index
+            where.append('ip_key BETWEEN ? AND ?')
+            params.extend(cidr_range(filters['cidr']))
+        else:
+            where.append('0')
+    if filters.get('term'):
+        # Prefix match as a range so it can use the search-term index
+        where.append(f"{source['term']} >= ? AND {source['term']} < ?")
+        params.extend([filters['term'], filters['term'] + '\U0010ffff'])
+
+    if cursor is not None:
+        timestamp, cursor_kind, cursor_id = cursor
+        if kind == cursor_kind:
+            where.append('(timestamp, id) < (?, ?)')
+            params.extend([timestamp, cursor_id])
+        elif kind < cursor_kind:
+            # Sorts after the cursor's kind at an equal timestamp
+            where.append('timestamp <= ?')
+            params.append(timestamp)
+        else:
+            where.append('timestamp < ?')
+            params.append(timestamp)
+
+    sql = f'''
+        SELECT * FROM (
+            SELECT '{kind}' AS type, {source['term']} AS search_term, country,
+                   {source['region']} AS region, {source['city']} AS city, {source['isp']} AS isp,
+                   timestamp, id
+            FROM {SEARCH_TABLES[kind]}
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        )
+    '''
+    params.append(page_size)
+    return sql, params
+
+
+def fetch_page(conn, kinds=('Phone', 'IP'), cursor=None, page_size=PAGE_SIZE, **filters):
+    """Fetch one page of history rows.
+
+    filters may include country, isp (substring), start/end (timestamp
+    strings, end exclusive), term (search term prefix) and cidr (IP searches
+    inside a network; raises ValueError if malformed). Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    queries = [_kind_query(kind, filters, cursor, page_size + 1) for kind in kinds]
+    sql = ' UNION ALL '.join(query for query, _ in queries)
+    sql += ' ORDER BY timestamp DESC, type DESC, id DESC LIMIT ?'
+    params = [param for _, query_params in queries for param in query_params] + [page_size + 1]
+
+    rows = conn.execute(sql, params).fetchall()
+    if len(rows) <= page_size and any(has_archive(kind) for kind in kinds):
+        # Archived rows are all older than live ones, so they continue the same order
+        archive_cursor = (rows[-1][6], rows[-1][0], rows[-1][7]) if rows else cursor
+        rows += fetch_archive_rows(kinds, archive_cursor, page_size + 1 - len(rows), filters)
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, (last[6], last[0], last[7])
+
+
+def get_country_options(conn):
+    """Return countries seen in the history, most searched first (read from rollups)"""
+    return [row[0] for row in conn.execute('''
+        SELECT country FROM search_country_counts
+        WHERE count > 0 AND country != ''
+        GROUP BY country
+        ORDER BY SUM(count) DESC
+    ''')]
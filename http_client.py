@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# (connect, read) timeouts in seconds; a slow upstream must never stall a script run
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 2.0
+POOL_SIZE = 16
+HOST_CONCURRENCY = 16
+LATENCY_SAMPLES = 500
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client with timeouts, jittered retries and per-host limits"""
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES,
+                 pool_size=POOL_SIZE, host_concurrency=HOST_CONCURRENCY, host_limits=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.host_concurrency = host_concurrency
+        self.host_limits = dict(host_limits or {})
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._stats = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                limit = self.host_limits.get(host, self.host_concurrency)
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(limit)
+            return semaphore
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats[host] = {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'latencies': deque(maxlen=LATENCY_SAMPLES),
+            }
+        return stats
+
+    def _record(self, host, elapsed, error):
+        with self._lock:
+            stats = self._host_stats(host)
+            stats['requests'] += 1
+            stats['latencies'].append(elapsed)
+            if error:
+                stats['errors'] += 1
+
+    def backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring a short Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), BACKOFF_CAP)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+    def request(self, method, url, retries=None, **kwargs):
+        """Send a request through the shared session, retrying transient failures.
+
+        retries overrides max_retries; pass 0 when the caller retries itself.
+        """
+        host = urlsplit(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+        retries = self.max_retries if retries is None else retries
+        retries = retries if method.upper() in IDEMPOTENT_METHODS else 0
+        semaphore = self._semaphore(host)
+        attempt = 0
+        while True:
+            response = None
+            start = time.perf_counter()
+            try:
+                with semaphore:
+                    response = self.session.request(method, url, **kwargs)
+            except TRANSIENT_ERRORS:
+                self._record(host, time.perf_counter() - start, error=True)
+                if attempt >= retries:
+                    raise
+            else:
+                self._record(host, time.perf_counter() - start, error=response.status_code >= 500)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                response.close()
+            attempt += 1
+            with self._lock:
+                self._host_stats(host)['retries'] += 1
+            time.sleep(self.backoff(attempt, response))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get_stats(self):
+        """Return per-host request counts, latency percentiles and connection reuse"""
+        hosts = {}
+        with self._lock:
+            for host, stats in self._stats.items():
+                latencies = sorted(stats['latencies'])
+                hosts[host] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                    'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+                    'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+                }
+
+        connections_opened = 0
+        requests_sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections_opened += pool.num_connections
+                requests_sent += pool.num_requests
+        return {
+            'hosts': hosts,
+            'connections_opened': connections_opened,
+            'requests_sent': requests_sent,
+            'connections_reused': max(requests_sent - connections_opened, 0),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide HTTP client, shared across Streamlit reruns and sessions"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
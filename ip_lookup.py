@@ -0,0 +1,148 @@
+import os
+import time
+
+from geo_db import get_geo_db
+from http_client import MAX_RETRIES, RETRY_STATUSES, TRANSIENT_ERRORS, get_client
+from lookup_cache import get_lookup_cache
+from metrics import timed
+from quota import INTERACTIVE, QuotaExceeded, get_scheduler
+
+
+# Overridable so benchmarks and tests can point at a local stand-in server
+IPINFO_URL = os.environ.get('GEONET_IPINFO_URL', "https://ipinfo.io/{}/json")
+IPIFY_URL = os.environ.get('GEONET_IPIFY_URL', "https://api.ipify.org?format=json")
+# ipinfo.io retries go through the quota scheduler so every HTTP attempt is charged
+IPINFO_ATTEMPTS = 1 + MAX_RETRIES
+# Responses that say something about the address itself and may be cached as
+# failures; auth errors (401/403) and rate limits are about the caller
+NEGATIVE_CACHE_STATUSES = {400, 404}
+
+
+def lookup_ip_local(ip_address, memory_only=False):
+    """Answer a lookup from the offline database or the cache without touching the network.
+
+    Returns a (data, error) tuple, or None when only ipinfo.io can answer.
+    With memory_only, the SQLite cache tier is skipped, so nothing blocks on disk.
+    """
+    cache_key = (ip_address or '').strip()
+    if not cache_key:
+        return None
+
+    # The offline range database answers covered addresses without touching the quota
+    geo_db = get_geo_db()
+    if geo_db is not None:
+        data = geo_db.lookup(cache_key)
+        if data is not None:
+            return data, None
+
+    # Serve repeat lookups (including recent failures) without a network round-trip
+    cache = get_lookup_cache()
+    cached = cache.get_memory(cache_key) if memory_only else cache.get(cache_key)
+    if cached is not None:
+        if cached.ok:
+            return cached.payload, None
+        return None, cached.payload.get('error', 'Lookup failed')
+    return None
+
+
+def lookup_ip(ip_address, on_response=None, priority=INTERACTIVE):
+    """Look up an IP in the offline database, falling back to cached ipinfo.io.
+
+    Returns a (data, error) tuple; exactly one of them is None. on_response,
+    if given, is called with the raw response whenever the network is hit.
+    priority is a quota.py priority; bulk callers should pass quota.BULK.
+    """
+    cache_key = (ip_address or '').strip()
+    local = lookup_ip_local(cache_key)
+    if local is not None:
+        return local
+    return fetch_ip(cache_key, on_response, priority)
+
+
+def _request_ipinfo(cache_key):
+    """One HTTP attempt; the client must not retry behind the scheduler's back"""
+    with timed('http.ipinfo') as timer:
+        response = get_client().get(IPINFO_URL.format(cache_key), retries=0)
+        if response.status_code != 200:
+            timer.fail()
+    if response.status_code == 429:
+        retry_after = response.headers.get('Retry-After', '')
+        get_scheduler().penalize(float(retry_after) if retry_after.isdigit() else 1.0)
+    return response
+
+
+def _scheduled_ipinfo(cache_key, priority):
+    """Call ipinfo.io through the scheduler, taking a token for each attempt.
+
+    A 429 has already penalized the scheduler, so the next token comes after
+    Retry-After; 5xx responses and connection errors back off with jitter.
+    """
+    scheduler = get_scheduler()
+    for attempt in range(1, IPINFO_ATTEMPTS + 1):
+        try:
+            # Only same-priority callers share a call; a bulk leader may be deferred
+            response = scheduler.run((cache_key, priority), lambda: _request_ipinfo(cache_key), priority)
+        except TRANSIENT_ERRORS:
+            if attempt == IPINFO_ATTEMPTS:
+                raise
+            time.sleep(get_client().backoff(attempt))
+            continue
+        if response.status_code not in RETRY_STATUSES or attempt == IPINFO_ATTEMPTS:
+            return response
+        if response.status_code != 429:
+            time.sleep(get_client().backoff(attempt))
+
+
+def fetch_ip(ip_address, on_response=None, priority=INTERACTIVE):
+    """Query ipinfo.io through the quota scheduler and cache the outcome; returns (data, error)"""
+    cache_key = (ip_address or '').strip()
+    cache = get_lookup_cache()
+
+    try:
+        # Use ipinfo.io (no API key required, generous free tier: 50,000 requests/month)
+        try:
+            response = _scheduled_ipinfo(cache_key, priority)
+        except QuotaExceeded as e:
+            # Near the quota an outdated answer beats none; nothing is cached for the failure
+            stale = cache.get_stale(cache_key) if cache_key else None
+            if stale is not None:
+                return stale, None
+            return None, f"Lookup deferred: {e}"
+        if on_response is not None:
+            on_response(response)
+        if response.status_code == 200:
+            data = response.json()
+            # ipinfo.io doesn't have a status field like ip-api, so we check if we got useful data
+            if data.get('ip'):
+                if cache_key:
+                    cache.put(cache_key, data)
+                return data, None
+            error = "API returned empty or invalid data"
+            if cache_key:
+                cache.put_failure(cache_key, error)
+            return None, error
+        error = f"HTTP error: {response.status_code}"
+        if cache_key and (response.status_code == 429 or response.status_code >= 500):
+            stale = cache.get_stale(cache_key)
+            if stale is not None:
+                return stale, None
+        # A bogus or unknown IP stays that way; a bad token or rate limit doesn't
+        if cache_key and response.status_code in NEGATIVE_CACHE_STATUSES:
+            cache.put_failure(cache_key, error)
+        return None, error
+    except Exception as e:
+        return None, f"Error fetching IP data: {str(e)}"
+
+
+def get_user_ip():
+    """Return the public IP seen by ipify.org, or None if it can't be detected"""
+    try:
+        with timed('http.ipify') as timer:
+            response = get_client().get(IPIFY_URL)
+            if response.status_code != 200:
+                timer.fail()
+        if response.status_code == 200:
+            return response.json().get('ip')
+    except Exception:
+        pass
+    return None
@@ -0,0 +1,237 @@
+"""Integer-encoded IP columns, network rollups and CIDR queries for ip_searches.
+
+Alongside the display text, every IP search stores:
+
+    ip_key               16-byte big-endian address, IPv4 as ::ffff:a.b.c.d, so a
+                         single index orders both families and a CIDR block is
+                         one key range (empty blob when searched_ip isn't an IP)
+    ip_prefix            the /24 (IPv4) or /48 (IPv6) network of the address
+    latitude, longitude  parsed from ipinfo's "lat,lon" string
+    asn                  parsed from ipinfo's org field ("AS15169 Google LLC")
+
+Per-prefix and per-ASN counts are kept current by triggers, like the country
+rollups. Databases created before these columns existed are upgraded on
+startup, or explicitly with:
+
+    python ip_storage.py migrate [tracker_data.db]
+"""
+import ipaddress
+import re
+import sqlite3
+import sys
+
+from rollups import restore_archived_counts
+
+
+DB_PATH = 'tracker_data.db'
+BACKFILL_CHUNK = 10000
+
+NETWORK_COLUMNS = ('ip_key', 'ip_prefix', 'latitude', 'longitude', 'asn')
+COLUMN_TYPES = {'ip_key': 'BLOB', 'ip_prefix': 'BLOB', 'latitude': 'REAL', 'longitude': 'REAL', 'asn': 'INTEGER'}
+
+IPV4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+# Prefix lengths in bytes of the 16-byte key: /24 of a mapped IPv4, /48 of IPv6
+IPV4_PREFIX_BYTES = 15
+IPV6_PREFIX_BYTES = 6
+
+_ASN_PATTERN = re.compile(r'^AS(\d+)\b')
+
+NETWORK_SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_ip_searches_ip_key ON ip_searches (ip_key);
+    CREATE INDEX IF NOT EXISTS idx_ip_searches_asn ON ip_searches (asn);
+    CREATE INDEX IF NOT EXISTS idx_ip_searches_location ON ip_searches (latitude, longitude);
+
+    CREATE TABLE IF NOT EXISTS search_prefix_counts (
+        prefix BLOB PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS search_asn_counts (
+        asn INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_search_prefix_counts_count ON search_prefix_counts (count);
+    CREATE INDEX IF NOT EXISTS idx_search_asn_counts_count ON search_asn_counts (count);
+
+    CREATE TRIGGER IF NOT EXISTS ip_searches_network_insert AFTER INSERT ON ip_searches
+    BEGIN
+        INSERT INTO search_prefix_counts (prefix, count)
+            SELECT NEW.ip_prefix, 1 WHERE NEW.ip_prefix IS NOT NULL
+            ON CONFLICT (prefix) DO UPDATE SET count = count + 1;
+        INSERT INTO search_asn_counts (asn, count)
+            SELECT NEW.asn, 1 WHERE NEW.asn IS NOT NULL
+            ON CONFLICT (asn) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS ip_searches_network_delete AFTER DELETE ON ip_searches
+    BEGIN
+        UPDATE search_prefix_counts SET count = count - 1 WHERE prefix = OLD.ip_prefix;
+        UPDATE search_asn_counts SET count = count - 1 WHERE asn = OLD.asn;
+    END;
+'''
+
+
+def encode_ip(value):
+    """Return the 16-byte key for an address string, or None if it isn't one"""
+    try:
+        address = ipaddress.ip_address((value or '').strip())
+    except ValueError:
+        return None
+    if address.version == 4:
+        return IPV4_MAPPED + address.packed
+    return address.packed
+
+
+def decode_ip(key):
+    """Inverse of encode_ip"""
+    if key[:12] == IPV4_MAPPED:
+        return str(ipaddress.IPv4Address(key[12:]))
+    return str(ipaddress.IPv6Address(key))
+
+
+def prefix_of(key):
+    """The /24 or /48 network key for an encoded address"""
+    if key[:12] == IPV4_MAPPED:
+        return key[:IPV4_PREFIX_BYTES]
+    return key[:IPV6_PREFIX_BYTES]
+
+
+def format_prefix(prefix):
+    """Render a stored prefix as CIDR text, e.g. 203.0.113.0/24"""
+    if len(prefix) == IPV4_PREFIX_BYTES:
+        network = ipaddress.IPv4Address(prefix[12:].ljust(4, b'\0'))
+        return f"{network}/24"
+    network = ipaddress.IPv6Address(prefix.ljust(16, b'\0'))
+    return f"{network}/{len(prefix) * 8}"
+
+
+def cidr_range(cidr):
+    """Return the inclusive (low, high) key range of a CIDR block; raises ValueError"""
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    low, high = network.network_address.packed, network.broadcast_address.packed
+    if network.version == 4:
+        return IPV4_MAPPED + low, IPV4_MAPPED + high
+    return low, high
+
+
+def parse_coordinates(text):
+    """Split ipinfo's "lat,lon" into floats, or (None, None)"""
+    try:
+        lat, lon = (float(part) for part in (text or '').split(','))
+    except ValueError:
+        return None, None
+    return lat, lon
+
+
+def parse_asn(org):
+    """Extract the AS number from an org string such as 'AS15169 Google LLC'"""
+    match = _ASN_PATTERN.match((org or '').strip())
+    return int(match.group(1)) if match else None
+
+
+def derive_columns(searched_ip, coordinates, isp):
+    """Compute NETWORK_COLUMNS for one ip_searches row"""
+    key = encode_ip(searched_ip)
+    lat, lon = parse_coordinates(coordinates)
+    if key is None:
+        return b'', None, lat, lon, parse_asn(isp)
+    return key, prefix_of(key), lat, lon, parse_asn(isp)
+
+
+def _add_missing_columns(conn):
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(ip_searches)')}
+    for column in NETWORK_COLUMNS:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE ip_searches ADD COLUMN {column} {COLUMN_TYPES[column]}')
+
+
+def backfill(conn, chunk_size=BACKFILL_CHUNK):
+    """Fill the network columns of rows written before they existed; returns rows updated"""
+    updated = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, searched_ip, coordinates, isp FROM ip_searches
+            WHERE ip_key IS NULL LIMIT ?
+        ''', (chunk_size,)).fetchall()
+        if not rows:
+            return updated
+        with conn:
+            conn.executemany(f'''
+                UPDATE ip_searches SET {', '.join(f'{column} = ?' for column in NETWORK_COLUMNS)}
+                WHERE id = ?
+            ''', [derive_columns(ip, coordinates, isp) + (row_id,) for row_id, ip, coordinates, isp in rows])
+        updated += len(rows)
+
+
+def rebuild_network_rollups(conn):
+    """Recompute the prefix and ASN counts from ip_searches"""
+    with conn:
+        conn.execute('DELETE FROM search_prefix_counts')
+        conn.execute('DELETE FROM search_asn_counts')
+        conn.execute('''
+            INSERT INTO search_prefix_counts (prefix, count)
+            SELECT ip_prefix, COUNT(*) FROM ip_searches WHERE ip_prefix IS NOT NULL GROUP BY ip_prefix
+        ''')
+        conn.execute('''
+            INSERT INTO search_asn_counts (asn, count)
+            SELECT asn, COUNT(*) FROM ip_searches WHERE asn IS NOT NULL GROUP BY asn
+        ''')
+        restore_archived_counts(conn, ('prefix', 'asn'))
+
+
+def ensure_ip_storage(conn):
+    """Add the network columns, indexes, rollups and triggers, migrating old rows"""
+    _add_missing_columns(conn)
+    conn.executescript(NETWORK_SCHEMA)
+    backfilled = backfill(conn)
+    never_built = (conn.execute('SELECT 1 FROM search_prefix_counts LIMIT 1').fetchone() is None
+                   and conn.execute('SELECT 1 FROM ip_searches WHERE ip_prefix IS NOT NULL LIMIT 1').fetchone())
+    if backfilled or never_built:
+        rebuild_network_rollups(conn)
+    return backfilled
+
+
+def get_top_prefixes(conn, limit=10):
+    """Return [(cidr, count)] for the most searched /24 and /48 networks"""
+    return [(format_prefix(prefix), count) for prefix, count in conn.execute('''
+        SELECT prefix, count FROM search_prefix_counts
+        WHERE count > 0
+        ORDER BY count DESC
+        LIMIT ?
+    ''', (limit,))]
+
+
+def get_top_asns(conn, limit=10):
+    """Return [(asn, org, count)] for the most searched autonomous systems"""
+    return conn.execute('''
+        SELECT a.asn,
+               IFNULL((SELECT isp FROM ip_searches WHERE asn = a.asn ORDER BY id DESC LIMIT 1), 'AS' || a.asn),
+               a.count
+        FROM search_asn_counts a
+        WHERE a.count > 0
+        ORDER BY a.count DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+
+
+def count_in_cidr(conn, cidr):
+    """Count IP searches whose address falls inside a CIDR block (index range scan)"""
+    low, high = cidr_range(cidr)
+    return conn.execute(
+        'SELECT COUNT(*) FROM ip_searches WHERE ip_key BETWEEN ? AND ?', (low, high)
+    ).fetchone()[0]
+
+
+def main(argv):
+    if len(argv) not in (2, 3) or argv[1] != 'migrate':
+        print("usage: python ip_storage.py migrate [db_path]", file=sys.stderr)
+        return 2
+    db_path = argv[2] if len(argv) == 3 else DB_PATH
+    conn = sqlite3.connect(db_path)
+    updated = ensure_ip_storage(conn)
+    conn.close()
+    print(f"Migrated {updated} ip_searches row(s) in {db_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+DB_PATH = 'tracker_data.db'
+
+# Successful lookups rarely change; failed/invalid ones are retried soon
+DEFAULT_TTL = 24 * 60 * 60
+NEGATIVE_TTL = 5 * 60
+# Expired successful lookups are kept this long as a fallback when the upstream quota runs out
+STALE_RETENTION = 30 * 24 * 60 * 60
+MEMORY_CAPACITY = 1024
+
+CacheEntry = namedtuple('CacheEntry', ['ok', 'payload'])
+
+
+class LookupCache:
+    """Two-tier lookup cache: bounded in-process LRU in front of a SQLite table"""
+
+    def __init__(self, db_path=DB_PATH, capacity=MEMORY_CAPACITY, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'stale_hits': 0,
+        }
+        self._init_table()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_table(self):
+        """Create the persistent cache table and drop rows too old to serve even as stale"""
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ip_lookup_cache (
+                lookup_key TEXT PRIMARY KEY,
+                ok INTEGER,
+                payload TEXT,
+                expires_at REAL
+            )
+        ''')
+        now = time.time()
+        conn.execute(
+            'DELETE FROM ip_lookup_cache WHERE (ok = 0 AND expires_at <= ?) OR expires_at <= ?',
+            (now, now - STALE_RETENTION)
+        )
+        conn.commit()
+        conn.close()
+
+    def _remember(self, key, expires_at, ok, payload):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._memory[key] = (expires_at, ok, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get_memory(self, key):
+        """Return a CacheEntry from the in-process tier only; never touches SQLite"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, ok, payload = entry
+            if expires_at <= now:
+                del self._memory[key]
+                self.stats['expired'] += 1
+                return None
+            self._memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            if not ok:
+                self.stats['negative_hits'] += 1
+            return CacheEntry(ok, payload)
+
+    def get(self, key):
+        """Return a CacheEntry for key, or None on a miss"""
+        entry = self.get_memory(key)
+        if entry is not None:
+            return entry
+
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT ok, payload, expires_at FROM ip_lookup_cache WHERE lookup_key = ?', (key,)
+        ).fetchone()
+        conn.close()
+
+        with self._lock:
+            if row is None or row[2] <= now:
+                if row is not None:
+                    self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            ok, payload = bool(row[0]), json.loads(row[1])
+            self._remember(key, row[2], ok, payload)
+            self.stats['disk_hits'] += 1
+            if not ok:
+                self.stats['negative_hits'] += 1
+            return CacheEntry(ok, payload)
+
+    def get_stale(self, key):
+        """Return a successful payload for key even if expired, or None"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT payload FROM ip_lookup_cache WHERE lookup_key = ? AND ok = 1', (key,)
+        ).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        with self._lock:
+            self.stats['stale_hits'] += 1
+        return json.loads(row[0])
+
+    def _store(self, key, ok, payload, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, expires_at, ok, payload)
+        conn = self._connect()
+        conn.execute('''
+            INSERT OR REPLACE INTO ip_lookup_cache (lookup_key, ok, payload, expires_at)
+            VALUES (?, ?, ?, ?)
+        ''', (key, int(ok), json.dumps(payload), expires_at))
+        conn.commit()
+        conn.close()
+
+    def put(self, key, data):
+        """Cache a successful lookup result"""
+        self._store(key, True, data, self.ttl)
+
+    def put_failure(self, key, error):
+        """Cache a failed or invalid lookup with the short negative TTL"""
+        self._store(key, False, {'error': error}, self.negative_ttl)
+
+    def clear_memory(self):
+        """Drop the in-process tier only; SQLite entries keep serving lookups"""
+        with self._lock:
+            self._memory.clear()
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        conn = self._connect()
+        conn.execute('DELETE FROM ip_lookup_cache')
+        conn.commit()
+        conn.close()
+
+    def get_stats(self):
+        """Return a snapshot of the hit/miss/eviction counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_size'] = len(self._memory)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_lookup_cache(db_path=DB_PATH):
+    """Return the process-wide lookup cache, shared across Streamlit reruns"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LookupCache(db_path)
+        return _cache
+
+
+def reset_lookup_cache(**kwargs):
+    """Replace the process-wide lookup cache with one built from kwargs; returns it.
+
+    With no kwargs the next get_lookup_cache() call builds a default one.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = LookupCache(**kwargs) if kwargs else None
+        return _cache
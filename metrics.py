@@ -0,0 +1,158 @@
+"""Lightweight per-stage latency histograms and error counters.
+
+Wrap a hot path in ``with timed('stage'):`` to record its duration. Recording
+costs one lock acquisition and a bucket search; when disabled (GEONET_METRICS=0
+or set_enabled(False)) ``timed`` returns a shared no-op and costs nothing.
+"""
+import bisect
+import os
+import threading
+import time
+
+
+# Upper bounds in seconds, Prometheus-style; the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get('GEONET_METRICS', '1') != '0'
+_lock = threading.Lock()
+_stages = {}
+
+
+class _Stage:
+    __slots__ = ('buckets', 'count', 'total', 'errors', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.max = 0.0
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    """Turn recording on or off at runtime, for every thread and session in the process"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def record(stage, seconds, error=False):
+    """Record one observation of stage taking `seconds`"""
+    if not _enabled:
+        return
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = _Stage()
+        stats.buckets[index] += 1
+        stats.count += 1
+        stats.total += seconds
+        if seconds > stats.max:
+            stats.max = seconds
+        if error:
+            stats.errors += 1
+
+
+class _Timer:
+    __slots__ = ('stage', 'start', 'failed')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.failed = False
+
+    def fail(self):
+        """Count this observation as an error even though no exception was raised"""
+        self.failed = True
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.stage, time.perf_counter() - self.start, self.failed or exc_type is not None)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def fail(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def timed(stage):
+    """Context manager timing a block; exceptions are counted as errors"""
+    return _Timer(stage) if _enabled else _NOOP
+
+
+def _quantile(stats, q):
+    """Upper bound of the bucket holding the q-th observation"""
+    target = q * stats.count
+    cumulative = 0
+    for bound, count in zip(BUCKETS + (float('inf'),), stats.buckets):
+        cumulative += count
+        if cumulative >= target:
+            return bound if bound != float('inf') else stats.max
+    return stats.max
+
+
+def snapshot():
+    """Return per-stage summaries: count, errors, mean/max and bucketed p50/p95 (ms)"""
+    with _lock:
+        stages = {name: (stats.count, stats.errors, stats.total, stats.max, _quantile(stats, 0.5), _quantile(stats, 0.95))
+                  for name, stats in _stages.items()}
+    return [
+        {
+            'stage': name,
+            'count': count,
+            'errors': errors,
+            'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            'p50_ms_le': round(p50 * 1000, 3),
+            'p95_ms_le': round(p95 * 1000, 3),
+            'max_ms': round(maximum * 1000, 3),
+        }
+        for name, (count, errors, total, maximum, p50, p95) in sorted(stages.items())
+    ]
+
+
+def render_prometheus():
+    """Render every stage in the Prometheus text exposition format"""
+    lines = [
+        '# HELP geonet_stage_duration_seconds Time spent in each tracker stage.',
+        '# TYPE geonet_stage_duration_seconds histogram',
+    ]
+    with _lock:
+        stages = sorted((name, list(stats.buckets), stats.count, stats.total, stats.errors)
+                        for name, stats in _stages.items())
+    for name, buckets, count, total, _ in stages:
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, buckets):
+            cumulative += bucket_count
+            lines.append(f'geonet_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'geonet_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'geonet_stage_duration_seconds_sum{{stage="{name}"}} {total}')
+        lines.append(f'geonet_stage_duration_seconds_count{{stage="{name}"}} {count}')
+    lines.append('# HELP geonet_stage_errors_total Failed operations in each tracker stage.')
+    lines.append('# TYPE geonet_stage_errors_total counter')
+    for name, _, _, _, errors in stages:
+        lines.append(f'geonet_stage_errors_total{{stage="{name}"}} {errors}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Forget every recorded observation"""
+    with _lock:
+        _stages.clear()
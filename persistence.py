@@ -0,0 +1,328 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from archive import ensure_archive_tables, get_archive_stamp
+from geo_bins import ensure_geo_bins
+from history import ensure_history_indexes
+from ip_storage import NETWORK_COLUMNS, derive_columns, ensure_ip_storage
+from metrics import timed
+from rollups import ensure_rollups
+
+
+DB_PATH = 'tracker_data.db'
+
+# Queue capacity in submissions; a bulk save is one submission
+QUEUE_SIZE = 10000
+# Rows per group commit; a submission is never split across commits
+BATCH_SIZE = 500
+# How long the writer keeps waiting for more rows while they are still arriving
+MAX_BATCH_DELAY = 0.05
+# Touched after every commit, next to the database, so other processes sharing it
+# (enrich.py --save, a second app instance) see the write too
+VERSION_STAMP_SUFFIX = '-version'
+# How long a producer blocks on a full queue before giving up
+PUT_TIMEOUT = 5.0
+LATENCY_SAMPLES = 500
+
+TABLE_COLUMNS = {
+    'phone_searches': ('phone_number', 'country', 'detected_operator', 'manual_operator', 'user_ip'),
+    'ip_searches': ('searched_ip', 'country', 'region', 'city', 'isp', 'coordinates', 'search_type', 'user_ip'),
+}
+
+# Columns the writer computes from each submitted row, off the caller's thread
+DERIVED_COLUMNS = {
+    'ip_searches': (NETWORK_COLUMNS, lambda row: derive_columns(row[0], row[5], row[4])),
+}
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS phone_searches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone_number TEXT,
+        country TEXT,
+        detected_operator TEXT,
+        manual_operator TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_ip TEXT
+    );
+    CREATE TABLE IF NOT EXISTS ip_searches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        searched_ip TEXT,
+        country TEXT,
+        region TEXT,
+        city TEXT,
+        isp TEXT,
+        coordinates TEXT,
+        search_type TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_ip TEXT,
+        ip_key BLOB,
+        ip_prefix BLOB,
+        latitude REAL,
+        longitude REAL,
+        asn INTEGER
+    );
+'''
+
+_STOP = object()
+
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+
+def connect(db_path=DB_PATH):
+    """Open a connection tuned for concurrent readers alongside the writer"""
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def init_schema(conn):
+    """Create the search tables, then their indexes, rollups, triggers and archive bookkeeping"""
+    conn.executescript(SCHEMA)
+    ensure_rollups(conn)
+    ensure_history_indexes(conn)
+    # Also migrates ip_searches rows written before the network columns existed
+    ensure_ip_storage(conn)
+    ensure_geo_bins(conn)
+    ensure_archive_tables(conn)
+
+
+def get_data_version(db_path=DB_PATH):
+    """Return a token that changes every time search history is committed or archived.
+
+    The counter covers this process's own writes, the version stamp writes from
+    other processes and the archive stamp `python archive.py run`.
+    """
+    try:
+        stamp = os.stat(db_path + VERSION_STAMP_SUFFIX).st_mtime_ns
+    except OSError:
+        stamp = 0
+    return _data_version, stamp, get_archive_stamp()
+
+
+def bump_data_version():
+    """Mark search history as changed, invalidating results cached on the version"""
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+        return _data_version
+
+
+def touch_version_stamp(db_path=DB_PATH):
+    """Mark search history in db_path as changed for every process sharing it"""
+    path = db_path + VERSION_STAMP_SUFFIX
+    # Explicit nanoseconds; the filesystem's own clock can be too coarse to tell commits apart
+    now = time.time_ns()
+    with open(path, 'a'):
+        pass
+    os.utime(path, ns=(now, now))
+
+
+def _utc_timestamp():
+    # Same format as SQLite's CURRENT_TIMESTAMP, captured when the search happens
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SaveTicket:
+    """Completion handle for one submission; its rows commit or fail together"""
+    __slots__ = ('_event', 'error')
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.error = None
+
+    def _done(self, error=None):
+        self.error = error
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """Block until the rows are committed; raises the writer's error if they weren't"""
+        if not self._event.wait(timeout):
+            raise TimeoutError("Search history write is still pending")
+        if self.error is not None:
+            raise self.error
+
+
+class SearchWriter:
+    """Write-behind queue that group-commits search history on one WAL connection"""
+
+    def __init__(self, db_path=DB_PATH, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 max_batch_delay=MAX_BATCH_DELAY):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_batch_delay = max_batch_delay
+        self.conn = connect(db_path)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._commit_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {
+            'rows_written': 0,
+            'batches_committed': 0,
+            'last_batch_size': 0,
+            'backpressure_waits': 0,
+            'rejected_rows': 0,
+            'errors': 0,
+            'last_error': None,
+        }
+        self._thread = threading.Thread(target=self._run, name='search-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, table, row):
+        """Queue one row for insertion; returns a SaveTicket"""
+        return self.submit_many(table, [row])
+
+    def submit_many(self, table, rows):
+        """Queue rows as one submission, committed in a single transaction.
+
+        Returns a SaveTicket. Raises queue.Full, with nothing queued, if the
+        writer can't keep up.
+        """
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unknown table: {table}")
+        timestamp = _utc_timestamp()
+        ticket = SaveTicket()
+        item = (table, [tuple(row) + (timestamp,) for row in rows], ticket)
+        if not item[1]:
+            ticket._done()
+            return ticket
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.stats['backpressure_waits'] += 1
+            try:
+                self._queue.put(item, timeout=PUT_TIMEOUT)
+            except queue.Full:
+                with self._lock:
+                    self.stats['rejected_rows'] += len(item[1])
+                raise
+        return ticket
+
+    def _next_batch(self):
+        """Block for the first item, then take whatever else is already queued.
+
+        A lone save commits as soon as the queue is empty; only while rows keep
+        arriving does the writer wait, up to max_batch_delay, to fill the batch.
+        """
+        batch = [self._queue.get()]
+        rows = 0 if batch[0] is _STOP else len(batch[0][1])
+        deadline = time.monotonic() + self.max_batch_delay
+        arriving = False
+        while rows < self.batch_size and batch[-1] is not _STOP:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if not arriving or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            arriving = True
+            batch.append(item)
+            if item is not _STOP:
+                rows += len(item[1])
+        return batch
+
+    def _write(self, items):
+        by_table = {}
+        for table, rows, _ in items:
+            for row in rows:
+                if table in DERIVED_COLUMNS:
+                    # Rows end with the submit timestamp
+                    row = row[:-1] + DERIVED_COLUMNS[table][1](row) + row[-1:]
+                by_table.setdefault(table, []).append(row)
+        row_count = sum(len(rows) for rows in by_table.values())
+
+        start = time.perf_counter()
+        with timed('db.write') as timer:
+            try:
+                with self.conn:
+                    for table, rows in by_table.items():
+                        derived = DERIVED_COLUMNS[table][0] if table in DERIVED_COLUMNS else ()
+                        columns = TABLE_COLUMNS[table] + derived + ('timestamp',)
+                        self.conn.executemany(
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                            rows
+                        )
+            except Exception as e:
+                timer.fail()
+                with self._lock:
+                    self.stats['errors'] += 1
+                    self.stats['last_error'] = str(e)
+                for _, _, ticket in items:
+                    ticket._done(e)
+                return
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._commit_latencies.append(elapsed)
+            self.stats['rows_written'] += row_count
+            self.stats['batches_committed'] += 1
+            self.stats['last_batch_size'] = row_count
+        try:
+            touch_version_stamp(self.db_path)
+        except OSError as e:
+            # The rows are committed; only other processes miss the change
+            with self._lock:
+                self.stats['last_error'] = str(e)
+        bump_data_version()
+        for _, _, ticket in items:
+            ticket._done()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            items = [item for item in batch if item is not _STOP]
+            if items:
+                self._write(items)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Block until every queued row has been committed"""
+        self._queue.join()
+
+    def close(self):
+        """Flush pending rows and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.conn.close()
+
+    def get_stats(self):
+        """Return queue depth, throughput counters and commit latency percentiles"""
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._commit_latencies)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['commit_p50_ms'] = round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None
+        stats['commit_p95_ms'] = round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None
+        stats['commit_max_ms'] = round(latencies[-1] * 1000, 2) if latencies else None
+        return stats
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(db_path=DB_PATH):
+    """Return the process-wide search writer, flushed automatically at exit"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SearchWriter(db_path)
+            atexit.register(_writer.close)
+        return _writer
@@ -0,0 +1,146 @@
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import phonenumbers
+from phonenumbers import PhoneNumberFormat, PhoneNumberType, carrier, geocoder
+
+from metrics import timed
+
+
+DEFAULT_REGION = "CH"
+PHONE_COLUMN_NAMES = ('phone', 'phone_number', 'number', 'mobile', 'msisdn')
+
+# Carrier and geocoder data are keyed on E.164 prefixes no longer than this
+PREFIX_LENGTH = max(carrier.CARRIER_LONGEST_PREFIX, geocoder.GEOCODE_LONGEST_PREFIX)
+MEMO_LIMIT = 200000
+
+# Below this size the process pool costs more than it saves
+PARALLEL_THRESHOLD = 5000
+CHUNK_SIZE = 2000
+
+MOBILE_TYPES = (PhoneNumberType.MOBILE, PhoneNumberType.FIXED_LINE_OR_MOBILE, PhoneNumberType.PAGER)
+
+_memo = {}
+
+
+def mask_number(phone_number):
+    """Partially mask a phone number for storage, matching the single-number tab"""
+    return phone_number[:5] + "***"
+
+
+def _describe(numobj, ntype, e164):
+    """Resolve (country, operator) for a parsed number, memoized per prefix.
+
+    Mirrors geocoder.description_for_number and carrier.name_for_number, but
+    reuses the number type computed once by the caller. Numbers sharing a
+    number type and their leading PREFIX_LENGTH digits resolve identically.
+    """
+    key = (ntype, e164[:1 + PREFIX_LENGTH])
+    result = _memo.get(key)
+    if result is not None:
+        return result
+
+    if ntype == PhoneNumberType.UNKNOWN:
+        country = ""
+    elif not phonenumbers.is_number_type_geographical(ntype, numobj.country_code):
+        country = geocoder.country_name_for_number(numobj, "en")
+    else:
+        country = geocoder.description_for_valid_number(numobj, "en")
+    operator = carrier.name_for_valid_number(numobj, "en") if ntype in MOBILE_TYPES else ""
+
+    if len(_memo) >= MEMO_LIMIT:
+        _memo.clear()
+    result = _memo[key] = (country, operator)
+    return result
+
+
+def analyze_number(phone_number, default_region=DEFAULT_REGION):
+    """Parse a phone number once and return its country and detected operator"""
+    phone_number = phone_number.strip()
+    try:
+        numobj = phonenumbers.parse(phone_number, default_region)
+    except phonenumbers.NumberParseException as e:
+        return {
+            'phone_number': phone_number,
+            'e164': '',
+            'valid': False,
+            'country': '',
+            'detected_operator': '',
+            'error': str(e),
+        }
+
+    ntype = phonenumbers.number_type(numobj)
+    e164 = phonenumbers.format_number(numobj, PhoneNumberFormat.E164)
+    country, operator = _describe(numobj, ntype, e164)
+    return {
+        'phone_number': phone_number,
+        'e164': e164,
+        'valid': ntype != PhoneNumberType.UNKNOWN,
+        'country': country,
+        'detected_operator': operator,
+        'error': '',
+    }
+
+
+def analyze_chunk(args):
+    """Analyze a (numbers, default_region) pair; the picklable unit of work for process pools"""
+    numbers, default_region = args
+    return [analyze_number(number, default_region) for number in numbers]
+
+
+def analyze_numbers(numbers, default_region=DEFAULT_REGION, workers=None):
+    """Analyze a list of phone numbers, fanning large inputs out across processes.
+
+    Returns result dicts in input order.
+    """
+    numbers = list(numbers)
+    workers = workers or os.cpu_count() or 1
+    with timed('phone.batch'):
+        if workers == 1 or len(numbers) < PARALLEL_THRESHOLD:
+            return analyze_chunk((numbers, default_region))
+
+        chunks = [(numbers[i:i + CHUNK_SIZE], default_region) for i in range(0, len(numbers), CHUNK_SIZE)]
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_results in executor.map(analyze_chunk, chunks):
+                results.extend(chunk_results)
+        return results
+
+
+def _dedupe(values):
+    seen = set()
+    numbers = []
+    for value in values:
+        value = value.strip()
+        if value and value not in seen:
+            seen.add(value)
+            numbers.append(value)
+    return numbers
+
+
+def parse_phone_list(text):
+    """Parse pasted phone numbers, one per line, deduped in first-seen order"""
+    return _dedupe(text.splitlines())
+
+
+def parse_phone_csv(text):
+    """Extract phone numbers from CSV text, using a phone-named header column if present"""
+    rows = csv.reader(io.StringIO(text))
+    header = next(rows, None)
+    if header is None:
+        return []
+
+    names = [name.strip().lower() for name in header]
+    for candidate in PHONE_COLUMN_NAMES:
+        if candidate in names:
+            column = names.index(candidate)
+            values = []
+            break
+    else:
+        # No recognisable header: treat the first column as numbers, header row included
+        column = 0
+        values = [header[0]] if header else []
+    values.extend(row[column] for row in rows if len(row) > column)
+    return _dedupe(values)
@@ -0,0 +1,287 @@
+"""Quota-aware scheduling of ipinfo.io calls.
+
+Every upstream lookup takes a token from a per-second bucket and counts against
+the monthly quota, which is persisted in tracker_data.db so it survives
+restarts and is shared by the app, CLI and API. Interactive lookups jump the
+queue, and the last INTERACTIVE_RESERVE of the month is kept for them alone.
+Identical queued lookups share one call.
+"""
+import atexit
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from metrics import timed
+
+
+DB_PATH = 'tracker_data.db'
+SERVICE = 'ipinfo'
+
+MONTHLY_QUOTA = int(os.environ.get('GEONET_IPINFO_MONTHLY_QUOTA', 50000))
+RATE_PER_SECOND = float(os.environ.get('GEONET_IPINFO_RATE', 50))
+BURST = 100
+# Share of the monthly quota only interactive lookups may spend
+INTERACTIVE_RESERVE = 0.1
+# Usage is written back at most this often rather than once per call
+FLUSH_INTERVAL = 5.0
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk', BACKGROUND: 'background'}
+# How long a lookup may wait in the queue for a rate token
+MAX_WAIT = {INTERACTIVE: 10.0, BULK: 120.0, BACKGROUND: 300.0}
+
+
+class QuotaExceeded(Exception):
+    """Raised when a lookup can't be scheduled without breaking the quota"""
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe, callers hold the scheduler lock"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Take a token and return 0, or return the seconds until one is available"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self, seconds):
+        """Push the bucket into debt so no token is handed out for `seconds`"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _current_period():
+    return datetime.now(timezone.utc).strftime('%Y-%m')
+
+
+class QuotaScheduler:
+    """Priority queue in front of a rate-limited, monthly-capped upstream"""
+
+    def __init__(self, db_path=DB_PATH, service=SERVICE, monthly_quota=MONTHLY_QUOTA,
+                 rate=RATE_PER_SECOND, burst=BURST, reserve=INTERACTIVE_RESERVE):
+        self.db_path = db_path
+        self.service = service
+        self.monthly_quota = monthly_quota
+        self.reserve = reserve
+        self.bucket = TokenBucket(rate, burst)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._tickets = itertools.count()
+        self._inflight = {}
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.stats = {
+            'scheduled': 0,
+            'deduped': 0,
+            'rejected': 0,
+            'throttled': 0,
+        }
+        self._init_table()
+        self.period = _current_period()
+        self.used = self._load_usage(self.period)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_table(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS upstream_usage (
+                service TEXT NOT NULL,
+                period TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (service, period)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _load_usage(self, period):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT requests FROM upstream_usage WHERE service = ? AND period = ?', (self.service, period)
+        ).fetchone()
+        conn.close()
+        return row[0] if row else 0
+
+    def _limit(self, priority):
+        if priority == INTERACTIVE:
+            return self.monthly_quota
+        return int(self.monthly_quota * (1 - self.reserve))
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """Block until this caller may make one upstream request.
+
+        Raises QuotaExceeded when the monthly allowance for the priority is
+        spent, or when no rate token frees up within the priority's max wait.
+        """
+        timeout = MAX_WAIT.get(priority, MAX_WAIT[BACKGROUND]) if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        ticket = (priority, next(self._tickets))
+        with timed('quota.wait'), self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    period = _current_period()
+                    if period != self.period:
+                        self._roll_period(period)
+                    if self.used >= self._limit(priority):
+                        self.stats['rejected'] += 1
+                        raise QuotaExceeded(
+                            f"ipinfo.io monthly quota exhausted for {PRIORITY_NAMES.get(priority, priority)} "
+                            f"lookups ({self.used}/{self.monthly_quota})"
+                        )
+                    wait = None
+                    if self._queue[0] == ticket:
+                        wait = self.bucket.take()
+                        if not wait:
+                            self.used += 1
+                            self._pending += 1
+                            self.stats['scheduled'] += 1
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['throttled'] += 1
+                        raise QuotaExceeded("ipinfo.io rate limit: lookup waited too long in the queue")
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def _roll_period(self, period):
+        self.flush_locked()
+        self.period = period
+        self.used = self._load_usage(period)
+
+    def run(self, key, fn, priority=INTERACTIVE):
+        """Call fn() once a request slot is granted; identical queued keys share one call"""
+        with self._cond:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.stats['deduped'] += 1
+
+        if leader:
+            try:
+                self.acquire(priority)
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._cond:
+                    del self._inflight[key]
+                call.event.set()
+        else:
+            call.event.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def penalize(self, seconds):
+        """Stop handing out tokens for a while, e.g. after an upstream 429"""
+        with self._cond:
+            self.bucket.drain(seconds)
+
+    def flush_locked(self):
+        """Persist unsaved usage; caller holds the lock"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                INSERT INTO upstream_usage (service, period, requests) VALUES (?, ?, ?)
+                ON CONFLICT (service, period)
+                DO UPDATE SET requests = requests + excluded.requests, updated_at = CURRENT_TIMESTAMP
+            ''', (self.service, self.period, self._pending))
+        # Pick up usage recorded by other processes sharing the database
+        row = conn.execute(
+            'SELECT requests FROM upstream_usage WHERE service = ? AND period = ?', (self.service, self.period)
+        ).fetchone()
+        conn.close()
+        self._pending = 0
+        self.used = max(self.used, row[0])
+
+    def flush(self):
+        """Persist unsaved usage counters"""
+        with self._cond:
+            self.flush_locked()
+
+    def get_stats(self):
+        """Return usage against the monthly quota, queue depth and scheduling counters"""
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({
+                'period': self.period,
+                'used': self.used,
+                'monthly_quota': self.monthly_quota,
+                'remaining': max(self.monthly_quota - self.used, 0),
+                'bulk_limit': self._limit(BULK),
+                'rate_per_second': self.bucket.rate,
+                'queued': len(self._queue),
+                'inflight_keys': len(self._inflight),
+            })
+        return stats
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(db_path=DB_PATH):
+    """Return the process-wide ipinfo.io scheduler, flushed automatically at exit"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler(db_path)
+            atexit.register(_scheduler.flush)
+        return _scheduler
+
+
+def reset_scheduler(**kwargs):
+    """Flush the process-wide scheduler and replace it with one built from kwargs; returns it.
+
+    With no kwargs the next get_scheduler() call builds a default one. A
+    replacement isn't flushed at exit; whoever installed it resets it.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.flush()
+        _scheduler = QuotaScheduler(**kwargs) if kwargs else None
+        return _scheduler
@@ -0,0 +1,198 @@
+"""Incrementally maintained analytics rollups for the search history tables.
+
+Triggers keep per-country, per-day and total counts up to date on every
+insert/delete, so the Analytics tab reads a handful of tiny tables instead of
+scanning the full history. Rows moved out to the Parquet archive (archive.py)
+keep counting: archiving adds their counts back after the delete triggers take
+them out, and records them in archive_rollups so rebuilds can do the same.
+For databases created before the rollups existed:
+
+    python rollups.py rebuild [tracker_data.db]
+"""
+import sqlite3
+import sys
+
+
+DB_PATH = 'tracker_data.db'
+
+# Rollup label -> source table
+SEARCH_TABLES = {
+    'Phone': 'phone_searches',
+    'IP': 'ip_searches',
+}
+
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS search_totals (
+        search_kind TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS search_country_counts (
+        search_kind TEXT,
+        country TEXT,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (search_kind, country)
+    );
+    CREATE TABLE IF NOT EXISTS search_daily_counts (
+        search_kind TEXT,
+        day TEXT,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (search_kind, day)
+    );
+    CREATE INDEX IF NOT EXISTS idx_search_country_counts_count ON search_country_counts (search_kind, count);
+
+    -- Counts of archived rows, already included in the live rollups:
+    -- rollup is total/country/day/prefix/asn/geo
+    CREATE TABLE IF NOT EXISTS archive_rollups (
+        rollup TEXT,
+        search_kind TEXT,
+        key,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (rollup, search_kind, key)
+    );
+'''
+
+# archive_rollups rollup -> (live rollup table, key columns)
+LIVE_ROLLUPS = {
+    'total': ('search_totals', ('search_kind',)),
+    'country': ('search_country_counts', ('search_kind', 'country')),
+    'day': ('search_daily_counts', ('search_kind', 'day')),
+    'prefix': ('search_prefix_counts', ('prefix',)),
+    'asn': ('search_asn_counts', ('asn',)),
+    'geo': ('search_geo_bins', ('cell',)),
+}
+
+TABLE_SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp);
+    DROP INDEX IF EXISTS idx_{table}_country;
+    CREATE INDEX IF NOT EXISTS idx_{table}_country_timestamp ON {table} (country, timestamp);
+
+    CREATE TRIGGER IF NOT EXISTS {table}_rollup_insert AFTER INSERT ON {table}
+    BEGIN
+        INSERT INTO search_totals (search_kind, count) VALUES ('{kind}', 1)
+            ON CONFLICT (search_kind) DO UPDATE SET count = count + 1;
+        INSERT INTO search_country_counts (search_kind, country, count)
+            VALUES ('{kind}', IFNULL(NEW.country, ''), 1)
+            ON CONFLICT (search_kind, country) DO UPDATE SET count = count + 1;
+        INSERT INTO search_daily_counts (search_kind, day, count)
+            VALUES ('{kind}', IFNULL(date(NEW.timestamp), ''), 1)
+            ON CONFLICT (search_kind, day) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {table}_rollup_delete AFTER DELETE ON {table}
+    BEGIN
+        UPDATE search_totals SET count = count - 1 WHERE search_kind = '{kind}';
+        UPDATE search_country_counts SET count = count - 1
+            WHERE search_kind = '{kind}' AND country = IFNULL(OLD.country, '');
+        UPDATE search_daily_counts SET count = count - 1
+            WHERE search_kind = '{kind}' AND day = IFNULL(date(OLD.timestamp), '');
+    END;
+'''
+
+
+def create_rollups(conn):
+    """Create rollup tables plus the history indexes and triggers that feed them"""
+    conn.executescript(ROLLUP_SCHEMA)
+    for kind, table in SEARCH_TABLES.items():
+        conn.executescript(TABLE_SCHEMA.format(table=table, kind=kind))
+
+
+def ensure_rollups(conn):
+    """Create the rollups if needed and backfill them on first use"""
+    create_rollups(conn)
+
+    # A totals row per kind is written by every rebuild, so none means never built
+    if conn.execute('SELECT COUNT(*) FROM search_totals').fetchone()[0] == 0:
+        rebuild_rollups(conn)
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from the full history tables in one transaction"""
+    with conn:
+        conn.execute('DELETE FROM search_totals')
+        conn.execute('DELETE FROM search_country_counts')
+        conn.execute('DELETE FROM search_daily_counts')
+        for kind, table in SEARCH_TABLES.items():
+            conn.execute(f'''
+                INSERT INTO search_totals (search_kind, count)
+                SELECT ?, COUNT(*) FROM {table}
+            ''', (kind,))
+            conn.execute(f'''
+                INSERT INTO search_country_counts (search_kind, country, count)
+                SELECT ?, IFNULL(country, ''), COUNT(*) FROM {table}
+                GROUP BY IFNULL(country, '')
+            ''', (kind,))
+            conn.execute(f'''
+                INSERT INTO search_daily_counts (search_kind, day, count)
+                SELECT ?, IFNULL(date(timestamp), ''), COUNT(*) FROM {table}
+                GROUP BY IFNULL(date(timestamp), '')
+            ''', (kind,))
+        restore_archived_counts(conn, ('total', 'country', 'day'))
+
+
+def add_rollup_counts(conn, rollup, counts):
+    """Add [(search_kind, key, count)] to the live rollup table of an archive rollup"""
+    table, columns = LIVE_ROLLUPS[rollup]
+    if columns == ('search_kind',):
+        values = [(kind, count) for kind, _, count in counts]
+    elif columns[0] == 'search_kind':
+        values = counts
+    else:
+        values = [(key, count) for _, key, count in counts]
+    names = ', '.join(columns)
+    conn.executemany(f'''
+        INSERT INTO {table} ({names}, count) VALUES ({', '.join('?' * (len(columns) + 1))})
+        ON CONFLICT ({names}) DO UPDATE SET count = count + excluded.count
+    ''', values)
+
+
+def restore_archived_counts(conn, rollups):
+    """Add archived rows back into rollups that were just recomputed from the live tables"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archive_rollups'").fetchone() is None:
+        return
+    for rollup in rollups:
+        add_rollup_counts(conn, rollup, conn.execute(
+            'SELECT search_kind, key, count FROM archive_rollups WHERE rollup = ?', (rollup,)
+        ).fetchall())
+
+
+def get_totals(conn):
+    """Return {search_kind: total searches}"""
+    totals = dict.fromkeys(SEARCH_TABLES, 0)
+    totals.update(conn.execute('SELECT search_kind, count FROM search_totals').fetchall())
+    return totals
+
+
+def get_top_countries(conn, kind, limit=10):
+    """Return [(country, count)] for the most searched countries of one kind"""
+    return conn.execute('''
+        SELECT country, count FROM search_country_counts
+        WHERE search_kind = ? AND count > 0
+        ORDER BY count DESC
+        LIMIT ?
+    ''', (kind, limit)).fetchall()
+
+
+def get_daily_counts(conn, days=30):
+    """Return [(day, search_kind, count)] for the most recent days with activity"""
+    return conn.execute('''
+        SELECT day, search_kind, count FROM search_daily_counts
+        WHERE day >= date('now', ?) AND count > 0
+        ORDER BY day
+    ''', (f'-{days} days',)).fetchall()
+
+
+def main(argv):
+    if len(argv) not in (2, 3) or argv[1] != 'rebuild':
+        print("usage: python rollups.py rebuild [db_path]", file=sys.stderr)
+        return 2
+    db_path = argv[2] if len(argv) == 3 else DB_PATH
+    conn = sqlite3.connect(db_path)
+    create_rollups(conn)
+    rebuild_rollups(conn)
+    print(f"Rebuilt rollups for {db_path}: {get_totals(conn)}")
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
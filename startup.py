@@ -0,0 +1,163 @@
+"""Cold-start timing and background warm-up for the Streamlit app.
+
+tracker.py imports only what the first render needs. pandas, phonenumbers
+(with its geocoder and carrier metadata), requests and the ipinfo lookup stack
+are imported inside the tabs that use them. After the first render a daemon
+thread imports them ahead of time, so switching tabs doesn't pay for them
+either; set GEONET_WARMUP=0 to turn it off.
+
+    python startup.py    # cold import cost of each heavy module, in a fresh process
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+
+# Set when tracker.py first runs in a fresh (or just woken) process
+STARTED = time.perf_counter()
+WARMUP_ENABLED = os.environ.get('GEONET_WARMUP', '1') != '0'
+
+# Warmed in roughly the order the tabs need them; earlier imports make later
+# ones cheaper, so each entry's cost is its own share
+WARMUP_MODULES = (
+    'requests',
+    'ip_lookup',
+    'pandas',
+    'phonenumbers',
+    'phonenumbers.geocoder',
+    'phonenumbers.carrier',
+    'phone_batch',
+)
+# Region metadata is loaded on first parse, not on import
+SAMPLE_NUMBERS = (('+41446681800', 'CH'), ('+40721234567', 'RO'))
+
+_lock = threading.Lock()
+_steps = []
+_seen = set()
+_warmup_thread = None
+
+
+def _record(name, seconds, kind):
+    with _lock:
+        if name in _seen:
+            return
+        _seen.add(name)
+        _steps.append({
+            'step': name,
+            'kind': kind,
+            'seconds': round(seconds, 4),
+            'at_s': round(time.perf_counter() - STARTED, 4),
+            'thread': threading.current_thread().name,
+        })
+
+
+class _Step:
+    __slots__ = ('name', 'kind', 'start')
+
+    def __init__(self, name, kind='init'):
+        self.name = name
+        self.kind = kind
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            _record(self.name, time.perf_counter() - self.start, self.kind)
+        return False
+
+
+def step(name, kind='init'):
+    """Time a one-off startup step; later runs of the same step aren't recorded"""
+    return _Step(name, kind)
+
+
+def mark(name):
+    """Record a milestone as the time elapsed since STARTED"""
+    _record(name, time.perf_counter() - STARTED, 'milestone')
+
+
+def load(name):
+    """Import a module, timing it if this is the first import in the process"""
+    if name in sys.modules:
+        # Still goes through the import lock, in case another thread is mid-import
+        return importlib.import_module(name)
+    with step(f'import {name}', 'import'):
+        return importlib.import_module(name)
+
+
+def warm_phone_metadata():
+    """Parse one number per region the phone tab uses, loading their metadata"""
+    phone_batch = load('phone_batch')
+    phonenumbers = load('phonenumbers')
+    geocoder = load('phonenumbers.geocoder')
+    carrier = load('phonenumbers.carrier')
+    for number, region in SAMPLE_NUMBERS:
+        parsed = phonenumbers.parse(number, region)
+        geocoder.description_for_number(parsed, 'en')
+        carrier.name_for_number(parsed, 'en')
+        phone_batch.analyze_number(number, region)
+
+
+def _warmup():
+    for name in WARMUP_MODULES:
+        try:
+            load(name)
+        except Exception:
+            # The tab that needs the module reports the error itself
+            pass
+    try:
+        with step('phone metadata', 'warm-up'):
+            warm_phone_metadata()
+    except Exception:
+        pass
+    mark('warm-up done')
+
+
+def start_warmup():
+    """Start the background warm-up once per process, unless disabled"""
+    global _warmup_thread
+    with _lock:
+        if not WARMUP_ENABLED or _warmup_thread is not None:
+            return False
+        _warmup_thread = threading.Thread(target=_warmup, name='warm-up', daemon=True)
+    _warmup_thread.start()
+    return True
+
+
+def get_report():
+    """Return the recorded startup steps in the order they finished"""
+    with _lock:
+        steps = [dict(row) for row in _steps]
+    return sorted(steps, key=lambda row: row['at_s'])
+
+
+def get_state():
+    """'disabled', 'not started', 'running' or 'done'"""
+    if not WARMUP_ENABLED:
+        return 'disabled'
+    if _warmup_thread is None:
+        return 'not started'
+    return 'running' if _warmup_thread.is_alive() else 'done'
+
+
+def main():
+    with step('import streamlit', 'import'):
+        import streamlit  # noqa: F401
+    for name in WARMUP_MODULES:
+        load(name)
+    with step('phone metadata', 'warm-up'):
+        warm_phone_metadata()
+    report = get_report()
+    width = max(len(row['step']) for row in report)
+    for row in report:
+        print(f"{row['step']:<{width}}  {row['seconds'] * 1000:8.1f} ms")
+    print(f"{'total':<{width}}  {sum(row['seconds'] for row in report) * 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,135 +1,282 @@
-import phonenumbers
+import startup
 import streamlit as st
-from phonenumbers import carrier, geocoder
-import requests
 import json
 import streamlit.components.v1 as components
 import sqlite3
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+from lookup_cache import get_lookup_cache
+from functools import partial
+from bulk_lookup import normalize_ip, parse_ip_csv, parse_ip_list, iter_lookups
+from persistence import bump_data_version, get_data_version, get_writer, init_schema
+from rollups import get_daily_counts, get_top_countries, get_totals
+from ip_storage import count_in_cidr, get_top_asns, get_top_prefixes
+from geo_bins import MAX_ZOOM, MIN_ZOOM, cell_size, get_map_bins
+from archive import count_archive_in_cidr, get_archive_stats
+from history import COLUMNS as HISTORY_COLUMNS, fetch_page, get_country_options
+import metrics
+from metrics import timed
+import time
 
+# pandas, phonenumbers, requests and the ipinfo lookup stack are imported
+# inside the functions that use them, so a cold start renders without them
+# (see startup.py)
+startup.mark('modules imported')
 
+
+@st.cache_resource(show_spinner=False)
 def init_database():
     """Initialize SQLite database and create tables if they don't exist"""
-    conn = sqlite3.connect('tracker_data.db')
-    cursor = conn.cursor()
-    
-    # Create phone tracking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS phone_searches (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone_number TEXT,
-            country TEXT,
-            detected_operator TEXT,
-            manual_operator TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            user_ip TEXT
-        )
-    ''')
-    
-    # Create IP tracking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ip_searches (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            searched_ip TEXT,
-            country TEXT,
-            region TEXT,
-            city TEXT,
-            isp TEXT,
-            coordinates TEXT,
-            search_type TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            user_ip TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with startup.step('init database'):
+        conn = sqlite3.connect('tracker_data.db')
+        
+        # Search tables plus the indexes, rollups and triggers that keep analytics current
+        init_schema(conn)
+        conn.close()
+    
+    # Rollups may have just been backfilled
+    bump_data_version()
+
+
+# How long a save waits for the background writer to commit
+SAVE_TIMEOUT = 10
+# Most recent rows shown while a bulk lookup is still running
+BULK_PREVIEW_ROWS = 50
 
 
 def save_phone_search(phone_number, country, detected_operator, manual_operator, user_ip):
-    """Save phone number search to database"""
+    """Save a phone number search through the background database writer; returns True once committed"""
     try:
-        conn = sqlite3.connect('tracker_data.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO phone_searches (phone_number, country, detected_operator, manual_operator, user_ip)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (phone_number, country, detected_operator, manual_operator, user_ip))
-        conn.commit()
-        conn.close()
+        get_writer().submit('phone_searches', (phone_number, country, detected_operator, manual_operator, user_ip)).wait(SAVE_TIMEOUT)
+        return True
     except Exception as e:
         st.error(f"Error saving phone search: {str(e)}")
+        return False
+
+
+def save_phone_searches(rows):
+    """Save many phone number searches in one transaction; returns True once committed"""
+    try:
+        get_writer().submit_many('phone_searches', rows).wait(SAVE_TIMEOUT)
+        return True
+    except Exception as e:
+        st.error(f"Error saving phone searches: {str(e)}")
+        return False
 
 
 def save_ip_search(searched_ip, country, region, city, isp, coordinates, search_type, user_ip):
-    """Save IP address search to database"""
+    """Save an IP address search through the background database writer; returns True once committed"""
     try:
-        conn = sqlite3.connect('tracker_data.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO ip_searches (searched_ip, country, region, city, isp, coordinates, search_type, user_ip)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (searched_ip, country, region, city, isp, coordinates, search_type, user_ip))
-        conn.commit()
-        conn.close()
+        get_writer().submit('ip_searches', (searched_ip, country, region, city, isp, coordinates, search_type, user_ip)).wait(SAVE_TIMEOUT)
+        return True
     except Exception as e:
         st.error(f"Error saving IP search: {str(e)}")
+        return False
+
+
+def save_ip_searches(rows):
+    """Save many IP address searches in one transaction; returns True once committed"""
+    try:
+        get_writer().submit_many('ip_searches', rows).wait(SAVE_TIMEOUT)
+        return True
+    except Exception as e:
+        st.error(f"Error saving IP searches: {str(e)}")
+        return False
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_search_statistics(data_version):
+    """Read statistics from the incrementally maintained rollup tables.
+    
+    Cached per data version, so reruns reuse the result until a search is saved.
+    """
+    import pandas as pd
+    
+    conn = sqlite3.connect('tracker_data.db')
+    try:
+        with timed('db.analytics'):
+            # Country and total counts come from rollups, so cost doesn't grow with history
+            phone_df = pd.DataFrame(get_top_countries(conn, 'Phone'), columns=['country', 'count'])
+            ip_df = pd.DataFrame(get_top_countries(conn, 'IP'), columns=['country', 'count'])
+            totals = get_totals(conn)
+            daily_df = pd.DataFrame(get_daily_counts(conn), columns=['day', 'type', 'count'])
+            prefix_df = pd.DataFrame(get_top_prefixes(conn), columns=['network', 'count'])
+            asn_df = pd.DataFrame(get_top_asns(conn), columns=['asn', 'organization', 'count'])
+    finally:
+        conn.close()
+    
+    return {
+        'phone_countries': phone_df,
+        'ip_countries': ip_df,
+        'total_phone': totals['Phone'],
+        'total_ip': totals['IP'],
+        'daily_counts': daily_df,
+        'top_prefixes': prefix_df,
+        'top_asns': asn_df
+    }
 
 
 def get_search_statistics():
     """Get statistics from the database"""
     try:
-        conn = sqlite3.connect('tracker_data.db')
-        
-        # Get phone search stats
-        phone_df = pd.read_sql_query('''
-            SELECT country, COUNT(*) as count
-            FROM phone_searches
-            GROUP BY country
-            ORDER BY count DESC
-            LIMIT 10
-        ''', conn)
-        
-        # Get IP search stats
-        ip_df = pd.read_sql_query('''
-            SELECT country, COUNT(*) as count
-            FROM ip_searches
-            GROUP BY country
-            ORDER BY count DESC
-            LIMIT 10
-        ''', conn)
-        
-        # Get total counts
-        total_phone = pd.read_sql_query('SELECT COUNT(*) as total FROM phone_searches', conn).iloc[0]['total']
-        total_ip = pd.read_sql_query('SELECT COUNT(*) as total FROM ip_searches', conn).iloc[0]['total']
-        
-        # Get recent searches
-        recent_searches = pd.read_sql_query('''
-            SELECT 'Phone' as type, phone_number as search_term, country, timestamp
-            FROM phone_searches
-            UNION ALL
-            SELECT 'IP' as type, searched_ip as search_term, country, timestamp
-            FROM ip_searches
-            ORDER BY timestamp DESC
-            LIMIT 20
-        ''', conn)
-        
-        conn.close()
-        
-        return {
-            'phone_countries': phone_df,
-            'ip_countries': ip_df,
-            'total_phone': total_phone,
-            'total_ip': total_ip,
-            'recent_searches': recent_searches
-        }
+        return load_search_statistics(get_data_version())
     except Exception as e:
         st.error(f"Error getting statistics: {str(e)}")
         return None
 
 
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_country_options(data_version):
+    """Countries offered by the history filters, cached per data version"""
+    conn = sqlite3.connect('tracker_data.db')
+    try:
+        return get_country_options(conn)
+    finally:
+        conn.close()
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_archive_stats(data_version):
+    """Archived row and file counts per table, cached per data version"""
+    conn = sqlite3.connect('tracker_data.db')
+    try:
+        return get_archive_stats(conn)
+    finally:
+        conn.close()
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_cidr_count(data_version, cidr):
+    """IP searches inside a CIDR block, live and archived, cached per data version"""
+    conn = sqlite3.connect('tracker_data.db')
+    try:
+        return count_in_cidr(conn, cidr) + count_archive_in_cidr(cidr)
+    finally:
+        conn.close()
+
+
+# Viewport (min_lat, min_lon, max_lat, max_lon) and default zoom for the map
+MAP_REGIONS = {
+    "World": (None, 1),
+    "Europe": ((34.0, -25.0, 72.0, 45.0), 3),
+    "North America": ((10.0, -170.0, 75.0, -50.0), 2),
+    "South America": ((-56.0, -82.0, 13.0, -34.0), 3),
+    "Africa": ((-35.0, -18.0, 38.0, 52.0), 3),
+    "Asia": ((-11.0, 25.0, 55.0, 150.0), 2),
+    "Oceania": ((-48.0, 110.0, 0.0, 180.0), 3),
+}
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_map_bins(data_version, zoom, bbox):
+    """Aggregated map tile for a zoom level and viewport, cached per data version"""
+    import pandas as pd
+    
+    conn = sqlite3.connect('tracker_data.db')
+    try:
+        bins = get_map_bins(conn, zoom, bbox)
+    finally:
+        conn.close()
+    map_df = pd.DataFrame(bins, columns=['lat', 'lon', 'count'])
+    # Circle area tracks the count; radius in metres is capped at half a cell
+    if not map_df.empty:
+        half_cell_m = cell_size(zoom) * 111000 / 2
+        map_df['radius'] = half_cell_m * (map_df['count'] / map_df['count'].max()) ** 0.5
+    return map_df
+
+
+def render_history_map():
+    """Binned map of every IP search location"""
+    col1, col2 = st.columns(2)
+    with col1:
+        region = st.selectbox("Region", list(MAP_REGIONS), key="map_region")
+    bbox, default_zoom = MAP_REGIONS[region]
+    with col2:
+        zoom = st.slider("Detail", MIN_ZOOM, MAX_ZOOM, default_zoom, key=f"map_zoom_{region}")
+    
+    map_df = load_map_bins(get_data_version(), zoom, bbox)
+    if map_df.empty:
+        st.info("No IP searches with coordinates yet.")
+        return
+    st.map(map_df, latitude='lat', longitude='lon', size='radius', zoom=default_zoom)
+    st.caption(f"{len(map_df):,} bins of {cell_size(zoom):g}° covering {int(map_df['count'].sum()):,} searches")
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_history_page(data_version, kinds, cursor, page_size, filters):
+    """One page of search history, cached per data version and filter set"""
+    conn = sqlite3.connect('tracker_data.db')
+    try:
+        with timed('db.history'):
+            return fetch_page(conn, kinds, cursor, page_size, **dict(filters))
+    finally:
+        conn.close()
+
+
+def render_history_browser():
+    """Filterable, keyset-paginated view over both search history tables"""
+    import pandas as pd
+    
+    data_version = get_data_version()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        kind = st.selectbox("Type", ["All", "Phone", "IP"], key="history_kind")
+        term = st.text_input("Search term starts with", key="history_term").strip()
+    with col2:
+        country = st.selectbox("Country", ["All"] + load_country_options(data_version), key="history_country")
+        isp = st.text_input("ISP / operator contains", key="history_isp").strip()
+    with col3:
+        date_range = st.date_input("Date range", value=[], key="history_dates")
+        page_size = st.selectbox("Rows per page", [20, 50, 100], key="history_page_size")
+    cidr = st.text_input("IP network (CIDR)", placeholder="e.g., 203.0.113.0/24 or 2001:db8::/32", key="history_cidr").strip()
+    
+    filters = {
+        'country': None if country == "All" else country,
+        'isp': isp or None,
+        'term': term or None,
+        'start': None,
+        'end': None,
+        'cidr': cidr or None,
+    }
+    if cidr:
+        try:
+            st.caption(f"{load_cidr_count(data_version, cidr):,} IP searches in {cidr}")
+        except ValueError as e:
+            st.error(f"Invalid CIDR: {str(e)}")
+            return
+    if len(date_range) == 2:
+        filters['start'] = date_range[0].strftime('%Y-%m-%d')
+        filters['end'] = (date_range[1] + timedelta(days=1)).strftime('%Y-%m-%d')
+    kinds = ("Phone", "IP") if kind == "All" else (kind,)
+    
+    # Changing any filter restarts paging from the newest rows
+    filter_key = (kinds, page_size, tuple(sorted(filters.items())))
+    if st.session_state.get('history_filter_key') != filter_key:
+        st.session_state.history_filter_key = filter_key
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+    
+    rows, next_cursor = load_history_page(data_version, kinds, cursors[-1], page_size, tuple(sorted(filters.items())))
+    
+    if rows:
+        page_df = pd.DataFrame(rows, columns=HISTORY_COLUMNS).drop(columns=['id'])
+        st.dataframe(page_df, use_container_width=True)
+    else:
+        st.info("No searches match these filters.")
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Newer", disabled=len(cursors) == 1, key="history_newer"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(cursors)}")
+    with col3:
+        if st.button("Older ➡️", disabled=next_cursor is None, key="history_older"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+
 def get_client_ip():
     """Get the real client IP using JavaScript"""
     # JavaScript code to fetch the real client IP
@@ -166,226 +313,289 @@ def get_client_ip():
 
 def track_ip(ip_address):
     """Track IP address and return geolocation and ISP information using ipinfo.io"""
-    try:
-        # Use ipinfo.io (no API key required, generous free tier: 50,000 requests/month)
-        url = f"https://ipinfo.io/{ip_address or ''}/json"
-        response = requests.get(url)
+    from ip_lookup import lookup_ip
+    
+    def show_response(response):
         st.write("API status code:", response.status_code)
         st.write("API raw response:", response.text)
-        if response.status_code == 200:
-            data = response.json()
-            # ipinfo.io doesn't have a status field like ip-api, so we check if we got useful data
-            if data.get('ip'):
-                return data
-            else:
-                st.error("API returned empty or invalid data")
-                return None
-        else:
-            st.error(f"HTTP error: {response.status_code}")
-            return None
-    except Exception as e:
-        st.error(f"Error fetching IP data: {str(e)}")
-        return None
+    
+    data, error = lookup_ip(ip_address, on_response=show_response)
+    if error:
+        st.error(error)
+    return data
 
 
-def main():
-    # Initialize database
-    init_database()
-    
-    st.title("Network Tracker: Phone Number & IP Address Intelligence")
-    st.subheader("Built using Python and Streamlit")
+def render_ip_tab():
+    """IP address lookup tab: auto-detect, custom IP and bulk modes"""
+    st.header("IP Address Intelligence & Geolocation")
+    st.info("Analyze IP addresses to get location, ISP, and network intelligence.")
     
-    # Privacy notice
-    st.info("🔒 **Privacy Notice:** This app automatically detects your IP address to provide accurate geolocation services. Search history is stored locally for analytics. No personal information is shared with third parties.")
+    # Initialize session state for client IP
+    if 'client_ip' not in st.session_state:
+        st.session_state.client_ip = None
     
-    # Create tabs for different tracking types
-    tab2, tab1, tab3 = st.tabs(["🌐 IP Address Intelligence", "📱 Phone Number Intelligence", "📊 Analytics & History"])
+    # Option to detect user's own IP or enter custom IP
+    ip_option = st.radio(
+        "Choose IP tracking option:",
+        ["Track My Real IP (Auto-Detect)", "Enter Custom IP", "Bulk Lookup (CSV / List)"]
+    )
     
-    with tab2:
-        st.header("IP Address Intelligence & Geolocation")
-        st.info("Analyze IP addresses to get location, ISP, and network intelligence.")
-        
-        # Initialize session state for client IP
-        if 'client_ip' not in st.session_state:
-            st.session_state.client_ip = None
+    if ip_option == "Track My Real IP (Auto-Detect)":
+        st.write("**Detecting your real IP address...**")
         
-        # Option to detect user's own IP or enter custom IP
-        ip_option = st.radio(
-            "Choose IP tracking option:",
-            ["Track My Real IP (Auto-Detect)", "Enter Custom IP"]
-        )
+        # Get client IP using JavaScript
+        get_client_ip()
         
-        if ip_option == "Track My Real IP (Auto-Detect)":
-            st.write("**Detecting your real IP address...**")
+        # Listen for messages from JavaScript
+        # Note: This is a simplified approach - in a real app you might need a more robust solution
+        if st.button("Track My Real IP Address"):
+            from ip_lookup import get_user_ip
             
-            # Get client IP using JavaScript
-            get_client_ip()
-            
-            # Listen for messages from JavaScript
-            # Note: This is a simplified approach - in a real app you might need a more robust solution
-            if st.button("Track My Real IP Address"):
-                # For now, we'll use a fallback method since direct JS communication is complex in Streamlit
-                with st.spinner("Fetching your real IP information..."):
-                    # Use a client-side IP detection service
-                    try:
-                        # First, get the real client IP
-                        client_ip_response = requests.get("https://api.ipify.org?format=json")
-                        if client_ip_response.status_code == 200:
-                            client_ip_data = client_ip_response.json()
-                            real_ip = client_ip_data.get('ip')
-                            st.success(f"🎯 **Your Real IP Detected:** {real_ip}")
-                            
-                            # Now get location data for the real IP
-                            ip_data = track_ip(real_ip)
-                        else:
-                            st.error("Could not detect your real IP. Please try the custom IP option.")
-                            ip_data = None
-                    except Exception as e:
-                        st.error(f"Error detecting real IP: {str(e)}")
-                        ip_data = None
+            # For now, we'll use a fallback method since direct JS communication is complex in Streamlit
+            with st.spinner("Fetching your real IP information..."):
+                # Use a client-side IP detection service
+                real_ip = get_user_ip()
+                if real_ip:
+                    st.success(f"🎯 **Your Real IP Detected:** {real_ip}")
                     
-                    if ip_data:
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.subheader("📍 Location Information")
-                            st.write(f"**IP Address:** {ip_data.get('ip', 'N/A')}")
-                            st.write(f"**Country:** {ip_data.get('country', 'N/A')}")
-                            st.write(f"**Region:** {ip_data.get('region', 'N/A')}")
-                            st.write(f"**City:** {ip_data.get('city', 'N/A')}")
-                            st.write(f"**Postal Code:** {ip_data.get('postal', 'N/A')}")
-                            st.write(f"**Timezone:** {ip_data.get('timezone', 'N/A')}")
-                        
-                        with col2:
-                            st.subheader("🌐 Network Information")
-                            st.write(f"**ISP:** {ip_data.get('org', 'N/A')}")
-                            st.write(f"**ASN:** {ip_data.get('asn', 'N/A')}")
-                            st.write(f"**Coordinates:** {ip_data.get('loc', 'N/A')}")
-                        
-                        # Map visualization (if coordinates available)
-                        if ip_data.get('loc'):
-                            st.subheader("🗺️ Location on Map")
-                            try:
-                                coords = ip_data.get('loc').split(',')
-                                map_data = {
-                                    'lat': [float(coords[0])],
-                                    'lon': [float(coords[1])]
-                                }
-                                st.map(map_data)
-                            except:
-                                st.error("Could not parse coordinates for map display")
-                        
-                        # Save to database
+                    # Now get location data for the real IP
+                    ip_data = track_ip(real_ip)
+                else:
+                    st.error("Could not detect your real IP. Please try the custom IP option.")
+                    ip_data = None
+                
+                if ip_data:
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        st.subheader("📍 Location Information")
+                        st.write(f"**IP Address:** {ip_data.get('ip', 'N/A')}")
+                        st.write(f"**Country:** {ip_data.get('country', 'N/A')}")
+                        st.write(f"**Region:** {ip_data.get('region', 'N/A')}")
+                        st.write(f"**City:** {ip_data.get('city', 'N/A')}")
+                        st.write(f"**Postal Code:** {ip_data.get('postal', 'N/A')}")
+                        st.write(f"**Timezone:** {ip_data.get('timezone', 'N/A')}")
+                    
+                    with col2:
+                        st.subheader("🌐 Network Information")
+                        st.write(f"**ISP:** {ip_data.get('org', 'N/A')}")
+                        st.write(f"**ASN:** {ip_data.get('asn', 'N/A')}")
+                        st.write(f"**Coordinates:** {ip_data.get('loc', 'N/A')}")
+                    
+                    # Map visualization (if coordinates available)
+                    if ip_data.get('loc'):
+                        st.subheader("🗺️ Location on Map")
                         try:
-                            user_ip_response = requests.get("https://api.ipify.org?format=json")
-                            user_ip = user_ip_response.json().get('ip', 'Unknown') if user_ip_response.status_code == 200 else 'Unknown'
+                            coords = ip_data.get('loc').split(',')
+                            map_data = {
+                                'lat': [float(coords[0])],
+                                'lon': [float(coords[1])]
+                            }
+                            st.map(map_data)
                         except:
-                            user_ip = 'Unknown'
-                        
-                        save_ip_search(
-                            ip_data.get('ip', ''),
-                            ip_data.get('country', ''),
-                            ip_data.get('region', ''),
-                            ip_data.get('city', ''),
-                            ip_data.get('org', ''),
-                            ip_data.get('loc', ''),
-                            'Auto-Detect',
-                            user_ip
-                        )
-                        
-                        # Additional information
-                        st.subheader("📊 Additional Details")
-                        st.json(ip_data)
+                            st.error("Could not parse coordinates for map display")
+                    
+                    # Save to database (the detected IP is the user's IP)
+                    user_ip = real_ip
+                    
+                    saved = save_ip_search(
+                        ip_data.get('ip', ''),
+                        ip_data.get('country', ''),
+                        ip_data.get('region', ''),
+                        ip_data.get('city', ''),
+                        ip_data.get('org', ''),
+                        ip_data.get('loc', ''),
+                        'Auto-Detect',
+                        user_ip
+                    )
+                    
+                    # Additional information
+                    st.subheader("📊 Additional Details")
+                    st.json(ip_data)
+                    if saved:
                         st.success("✅ Search saved to history!")
-                    else:
-                        st.error("Failed to fetch IP information. Please try again.")
+                else:
+                    st.error("Failed to fetch IP information. Please try again.")
+    
+    elif ip_option == "Enter Custom IP":
+        custom_ip = st.text_input("Enter IP Address to Track:", placeholder="e.g., 8.8.8.8")
         
-        else:  # Enter Custom IP
-            custom_ip = st.text_input("Enter IP Address to Track:", placeholder="e.g., 8.8.8.8")
+        if st.button("Track IP Address"):
+            from ip_lookup import get_user_ip
             
-            if st.button("Track IP Address"):
-                if custom_ip:
-                    # Basic IP validation
-                    import re
-                    ip_pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
-                    if re.match(ip_pattern, custom_ip):
-                        with st.spinner(f"Tracking IP: {custom_ip}..."):
-                            ip_data = track_ip(custom_ip)
-                            if ip_data:
-                                col1, col2 = st.columns(2)
-                                
-                                with col1:
-                                    st.subheader("📍 Location Information")
-                                    st.write(f"**IP Address:** {ip_data.get('ip', 'N/A')}")
-                                    st.write(f"**Country:** {ip_data.get('country', 'N/A')}")
-                                    st.write(f"**Region:** {ip_data.get('region', 'N/A')}")
-                                    st.write(f"**City:** {ip_data.get('city', 'N/A')}")
-                                    st.write(f"**Postal Code:** {ip_data.get('postal', 'N/A')}")
-                                    st.write(f"**Timezone:** {ip_data.get('timezone', 'N/A')}")
-                                
-                                with col2:
-                                    st.subheader("🌐 Network Information")
-                                    st.write(f"**ISP:** {ip_data.get('org', 'N/A')}")
-                                    st.write(f"**ASN:** {ip_data.get('asn', 'N/A')}")
-                                    st.write(f"**Coordinates:** {ip_data.get('loc', 'N/A')}")
-                                
-                                # Map visualization (if coordinates available)
-                                if ip_data.get('loc'):
-                                    st.subheader("🗺️ Location on Map")
-                                    try:
-                                        coords = ip_data.get('loc').split(',')
-                                        map_data = {
-                                            'lat': [float(coords[0])],
-                                            'lon': [float(coords[1])]
-                                        }
-                                        st.map(map_data)
-                                    except:
-                                        st.error("Could not parse coordinates for map display")
-                                
-                                # Save to database
+            if custom_ip:
+                # Accepts IPv4 and IPv6, returned in canonical form
+                normalized_ip = normalize_ip(custom_ip)
+                if normalized_ip:
+                    custom_ip = normalized_ip
+                    with st.spinner(f"Tracking IP: {custom_ip}..."):
+                        ip_data = track_ip(custom_ip)
+                        if ip_data:
+                            col1, col2 = st.columns(2)
+                            
+                            with col1:
+                                st.subheader("📍 Location Information")
+                                st.write(f"**IP Address:** {ip_data.get('ip', 'N/A')}")
+                                st.write(f"**Country:** {ip_data.get('country', 'N/A')}")
+                                st.write(f"**Region:** {ip_data.get('region', 'N/A')}")
+                                st.write(f"**City:** {ip_data.get('city', 'N/A')}")
+                                st.write(f"**Postal Code:** {ip_data.get('postal', 'N/A')}")
+                                st.write(f"**Timezone:** {ip_data.get('timezone', 'N/A')}")
+                            
+                            with col2:
+                                st.subheader("🌐 Network Information")
+                                st.write(f"**ISP:** {ip_data.get('org', 'N/A')}")
+                                st.write(f"**ASN:** {ip_data.get('asn', 'N/A')}")
+                                st.write(f"**Coordinates:** {ip_data.get('loc', 'N/A')}")
+                            
+                            # Map visualization (if coordinates available)
+                            if ip_data.get('loc'):
+                                st.subheader("🗺️ Location on Map")
                                 try:
-                                    user_ip_response = requests.get("https://api.ipify.org?format=json")
-                                    user_ip = user_ip_response.json().get('ip', 'Unknown') if user_ip_response.status_code == 200 else 'Unknown'
+                                    coords = ip_data.get('loc').split(',')
+                                    map_data = {
+                                        'lat': [float(coords[0])],
+                                        'lon': [float(coords[1])]
+                                    }
+                                    st.map(map_data)
                                 except:
-                                    user_ip = 'Unknown'
-                                
-                                save_ip_search(
-                                    ip_data.get('ip', ''),
-                                    ip_data.get('country', ''),
-                                    ip_data.get('region', ''),
-                                    ip_data.get('city', ''),
-                                    ip_data.get('org', ''),
-                                    ip_data.get('loc', ''),
-                                    'Custom IP',
-                                    user_ip
-                                )
-                                
-                                # Additional information
-                                st.subheader("📊 Raw API Response")
-                                st.json(ip_data)
+                                    st.error("Could not parse coordinates for map display")
+                            
+                            # Save to database
+                            user_ip = get_user_ip() or 'Unknown'
+                            
+                            saved = save_ip_search(
+                                ip_data.get('ip', ''),
+                                ip_data.get('country', ''),
+                                ip_data.get('region', ''),
+                                ip_data.get('city', ''),
+                                ip_data.get('org', ''),
+                                ip_data.get('loc', ''),
+                                'Custom IP',
+                                user_ip
+                            )
+                            
+                            # Additional information
+                            st.subheader("📊 Raw API Response")
+                            st.json(ip_data)
+                            if saved:
                                 st.success("✅ Search saved to history!")
-                            else:
-                                st.error("Failed to fetch IP information. Please check the IP address and try again.")
-                    else:
-                        st.error("Please enter a valid IP address format (e.g., 192.168.1.1)")
+                        else:
+                            st.error("Failed to fetch IP information. Please check the IP address and try again.")
                 else:
-                    st.warning("Please enter an IP address to track.")
+                    st.error("Please enter a valid IPv4 or IPv6 address (e.g., 192.168.1.1 or 2001:4860:4860::8888)")
+            else:
+                st.warning("Please enter an IP address to track.")
     
-    with tab1:
-        st.header("Phone Number Intelligence & Service Operator Identifier")
-        st.info("Note: The detected service operator is based on the original number assignment and may not reflect the current operator if the number has been ported.")
+    else:  # Bulk Lookup
+        import pandas as pd
+        from http_client import get_client
+        from ip_lookup import get_user_ip, lookup_ip
+        from quota import BULK
+        
+        st.write("Upload a CSV (with an `ip` column, or IPs in the first column) or paste a list of addresses.")
+        uploaded_file = st.file_uploader("Upload IP list:", type=["csv", "txt"])
+        pasted_ips = st.text_area("Or paste IP addresses (one per line or comma-separated):")
+        concurrency = st.slider("Concurrent lookups", 1, get_client().host_concurrency, 8)
+        
+        if st.button("Run Bulk Lookup"):
+            ips, invalid = [], []
+            if uploaded_file is not None:
+                text = uploaded_file.getvalue().decode("utf-8", errors="ignore")
+                if uploaded_file.name.lower().endswith(".csv"):
+                    ips, invalid = parse_ip_csv(text)
+                else:
+                    ips, invalid = parse_ip_list(text)
+            if pasted_ips.strip():
+                pasted, pasted_invalid = parse_ip_list(pasted_ips)
+                ips, _ = parse_ip_list("\n".join(ips + pasted))
+                invalid += pasted_invalid
+            
+            if invalid:
+                st.warning(f"Skipped {len(invalid)} invalid entries (e.g. {', '.join(invalid[:3])})")
+            
+            if ips:
+                st.write(f"**Looking up {len(ips)} unique IP addresses...**")
+                progress = st.progress(0.0)
+                table = st.empty()
+                results = []
+                rows = []
+                last_render = 0.0
+                
+                for done, (ip, ip_data, error) in enumerate(iter_lookups(ips, partial(lookup_ip, priority=BULK), concurrency), 1):
+                    ip_data = ip_data or {}
+                    results.append({
+                        'ip': ip,
+                        'country': ip_data.get('country', ''),
+                        'region': ip_data.get('region', ''),
+                        'city': ip_data.get('city', ''),
+                        'isp': ip_data.get('org', ''),
+                        'coordinates': ip_data.get('loc', ''),
+                        'error': error or '',
+                    })
+                    if not error:
+                        rows.append((
+                            ip_data.get('ip', ip),
+                            ip_data.get('country', ''),
+                            ip_data.get('region', ''),
+                            ip_data.get('city', ''),
+                            ip_data.get('org', ''),
+                            ip_data.get('loc', ''),
+                            'Bulk',
+                        ))
+                    
+                    # Stream the latest rows at most every 0.5s; a bounded tail keeps each redraw cheap
+                    progress.progress(done / len(ips), text=f"{done}/{len(ips)} looked up")
+                    if time.monotonic() - last_render > 0.5:
+                        table.dataframe(pd.DataFrame(results[-BULK_PREVIEW_ROWS:]), use_container_width=True)
+                        last_render = time.monotonic()
+                
+                table.dataframe(pd.DataFrame(results), use_container_width=True)
+                user_ip = get_user_ip() or 'Unknown'
+                saved = save_ip_searches([row + (user_ip,) for row in rows])
+                
+                failed = len(results) - len(rows)
+                if saved:
+                    st.success(f"✅ {len(rows)} lookups saved to history!" + (f" ({failed} failed)" if failed else ""))
+                st.download_button(
+                    "Download results as CSV",
+                    pd.DataFrame(results).to_csv(index=False),
+                    file_name="bulk_ip_lookup.csv",
+                    mime="text/csv"
+                )
+            else:
+                st.warning("Please upload or paste at least one valid IP address.")
+
+
+def render_phone_tab():
+    """Phone number tab: single-number and batch analysis"""
+    import pandas as pd
+    import phonenumbers
+    from phonenumbers import carrier, geocoder
+    from ip_lookup import get_user_ip
+    from phone_batch import analyze_numbers, mask_number, parse_phone_csv, parse_phone_list
+    
+    st.header("Phone Number Intelligence & Service Operator Identifier")
+    st.info("Note: The detected service operator is based on the original number assignment and may not reflect the current operator if the number has been ported.")
+    phone_option = st.radio(
+        "Choose phone tracking option:",
+        ["Single Number", "Batch Analysis (CSV / List)"]
+    )
+    
+    if phone_option == "Single Number":
         mobile_number = st.text_input("Enter Your Phone Number: ", type="password")
         manual_operator = st.text_input("(Optional) Enter your current operator if ported (e.g., Jio, Airtel, Vi):")
         
         if st.button("Track Phone Number"):
             if mobile_number:
-                ch_number = phonenumbers.parse(mobile_number, "CH")
-                country = geocoder.description_for_number(ch_number, "en")
+                with timed('phone.parse'):
+                    ch_number = phonenumbers.parse(mobile_number, "CH")
+                    country = geocoder.description_for_number(ch_number, "en")
+                    
+                    services_operator = phonenumbers.parse(mobile_number, "RO")
+                    detected_operator = carrier.name_for_number(services_operator, "en")
                 st.success(f"Country Name: {country}")
                 
-                services_operator = phonenumbers.parse(mobile_number, "RO")
-                detected_operator = carrier.name_for_number(services_operator, "en")
-                
                 if manual_operator.strip():
                     st.success(f"Service Operator (Manual): {manual_operator.strip()}")
                     st.info(f"(Detected Operator: {detected_operator})")
@@ -393,76 +603,244 @@ def main():
                     st.success(f"Service Operator: {detected_operator}")
                 
                 # Get user's IP for logging
-                try:
-                    user_ip_response = requests.get("https://api.ipify.org?format=json")
-                    user_ip = user_ip_response.json().get('ip', 'Unknown') if user_ip_response.status_code == 200 else 'Unknown'
-                except:
-                    user_ip = 'Unknown'
+                user_ip = get_user_ip() or 'Unknown'
                 
                 # Save to database
-                save_phone_search(
+                saved = save_phone_search(
                     mobile_number[:5] + "***",  # Partially mask phone number for privacy
                     country,
                     detected_operator,
                     manual_operator.strip() if manual_operator.strip() else None,
                     user_ip
                 )
-                st.success("✅ Search saved to history!")
+                if saved:
+                    st.success("✅ Search saved to history!")
             else:
                 st.warning("Please enter a phone number to track.")
     
-    with tab3:
-        st.header("📊 Analytics & Search History")
-        
-        # Get statistics
-        stats = get_search_statistics()
+    else:  # Batch Analysis
+        st.write("Upload a CSV (with a `phone` column, or numbers in the first column) or paste one number per line. Numbers should include the country code (e.g. +91...).")
+        uploaded_numbers = st.file_uploader("Upload phone number list:", type=["csv", "txt"])
+        pasted_numbers = st.text_area("Or paste phone numbers (one per line):")
         
-        if stats:
-            # Overview metrics
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("📱 Total Phone Searches", stats['total_phone'])
-            with col2:
-                st.metric("🌐 Total IP Searches", stats['total_ip'])
-            with col3:
-                st.metric("🔍 Total Searches", stats['total_phone'] + stats['total_ip'])
-            
-            st.markdown("---")
-            
-            # Country statistics
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("📱 Top Countries (Phone Searches)")
-                if not stats['phone_countries'].empty:
-                    st.dataframe(stats['phone_countries'], use_container_width=True)
-                    st.bar_chart(stats['phone_countries'].set_index('country')['count'])
-                else:
-                    st.info("No phone searches yet.")
-            
-            with col2:
-                st.subheader("🌐 Top Countries (IP Searches)")
-                if not stats['ip_countries'].empty:
-                    st.dataframe(stats['ip_countries'], use_container_width=True)
-                    st.bar_chart(stats['ip_countries'].set_index('country')['count'])
+        if st.button("Analyze Phone Numbers"):
+            numbers = []
+            if uploaded_numbers is not None:
+                text = uploaded_numbers.getvalue().decode("utf-8", errors="ignore")
+                if uploaded_numbers.name.lower().endswith(".csv"):
+                    numbers = parse_phone_csv(text)
                 else:
-                    st.info("No IP searches yet.")
+                    numbers = parse_phone_list(text)
+            if pasted_numbers.strip():
+                numbers = parse_phone_list("\n".join(numbers + parse_phone_list(pasted_numbers)))
             
-            st.markdown("---")
-            
-            # Recent searches
-            st.subheader("🕐 Recent Searches")
-            if not stats['recent_searches'].empty:
-                st.dataframe(stats['recent_searches'], use_container_width=True)
+            if numbers:
+                with st.spinner(f"Analyzing {len(numbers)} phone numbers..."):
+                    start = time.perf_counter()
+                    results = analyze_numbers(numbers)
+                    elapsed = time.perf_counter() - start
+                
+                results_df = pd.DataFrame(results)
+                st.success(f"Analyzed {len(results)} numbers in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):,.0f} numbers/s)")
+                st.dataframe(results_df.drop(columns=['e164']), use_container_width=True)
+                
+                # Save to database (masked, like single-number searches)
+                user_ip = get_user_ip() or 'Unknown'
+                saved = save_phone_searches([
+                    (mask_number(row['phone_number']), row['country'], row['detected_operator'], None, user_ip)
+                    for row in results if not row['error']
+                ])
+                if saved:
+                    st.success("✅ Searches saved to history!")
+                st.download_button(
+                    "Download results as CSV",
+                    results_df.to_csv(index=False),
+                    file_name="phone_analysis.csv",
+                    mime="text/csv"
+                )
+            else:
+                st.warning("Please upload or paste at least one phone number.")
+
+
+def render_metrics_panel():
+    """Per-stage latency/error metrics with a Prometheus text export"""
+    import pandas as pd
+    
+    st.subheader("⏱️ Performance Metrics")
+    # Recording is process-wide, so it is configured by the operator (GEONET_METRICS), not per session
+    if not metrics.is_enabled():
+        st.caption("Stage timing is off for this deployment (GEONET_METRICS=0).")
+    
+    stage_stats = metrics.snapshot()
+    if stage_stats:
+        st.dataframe(pd.DataFrame(stage_stats), use_container_width=True)
+    else:
+        st.info("No timings recorded yet.")
+    
+    prometheus_text = metrics.render_prometheus()
+    st.download_button(
+        "Download Prometheus metrics",
+        prometheus_text,
+        file_name="geonet_metrics.prom",
+        mime="text/plain"
+    )
+    with st.expander("Prometheus export"):
+        st.code(prometheus_text, language="text")
+    
+    with st.expander("🚀 Startup"):
+        st.caption(f"Time since the app process started, and one-off import and init costs. Background warm-up: {startup.get_state()}.")
+        st.dataframe(pd.DataFrame(startup.get_report()), use_container_width=True)
+
+
+def render_analytics_tab():
+    """Analytics tab: rollup statistics, history browser and runtime stats"""
+    from http_client import get_client
+    from quota import get_scheduler
+    
+    st.header("📊 Analytics & Search History")
+    
+    # Get statistics
+    stats = get_search_statistics()
+    
+    if stats:
+        # Overview metrics
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("📱 Total Phone Searches", stats['total_phone'])
+        with col2:
+            st.metric("🌐 Total IP Searches", stats['total_ip'])
+        with col3:
+            st.metric("🔍 Total Searches", stats['total_phone'] + stats['total_ip'])
+        
+        st.markdown("---")
+        
+        # Country statistics
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("📱 Top Countries (Phone Searches)")
+            if not stats['phone_countries'].empty:
+                st.dataframe(stats['phone_countries'], use_container_width=True)
+                st.bar_chart(stats['phone_countries'].set_index('country')['count'])
             else:
-                st.info("No searches yet.")
+                st.info("No phone searches yet.")
         
+        with col2:
+            st.subheader("🌐 Top Countries (IP Searches)")
+            if not stats['ip_countries'].empty:
+                st.dataframe(stats['ip_countries'], use_container_width=True)
+                st.bar_chart(stats['ip_countries'].set_index('country')['count'])
+            else:
+                st.info("No IP searches yet.")
+        
+        st.markdown("---")
+        
+        # Daily activity
+        st.subheader("📈 Searches per Day (Last 30 Days)")
+        if not stats['daily_counts'].empty:
+            st.line_chart(stats['daily_counts'].pivot(index='day', columns='type', values='count').fillna(0))
         else:
-            st.error("Could not load analytics data.")
+            st.info("No searches in the last 30 days.")
+        
+        st.markdown("---")
+        
+        # Network breakdown (prefix and ASN counts are trigger-maintained rollups)
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("🧭 Top Networks (/24, /48)")
+            if not stats['top_prefixes'].empty:
+                st.dataframe(stats['top_prefixes'], use_container_width=True)
+            else:
+                st.info("No IP searches yet.")
+        
+        with col2:
+            st.subheader("🏢 Top ASNs")
+            if not stats['top_asns'].empty:
+                st.dataframe(stats['top_asns'], use_container_width=True)
+            else:
+                st.info("No ASN data yet.")
+        
+        st.markdown("---")
+        
+        # Map of all IP searches, binned on the server
+        st.subheader("🗺️ Search Map")
+        render_history_map()
+        
+        st.markdown("---")
+        
+        # Search history browser (newest first, one page at a time)
+        st.subheader("🕐 Search History")
+        render_history_browser()
+        
+        with st.expander("⚡ IP Lookup Cache"):
+            st.json(get_lookup_cache().get_stats())
+        
+        with st.expander("🔌 Upstream HTTP Client"):
+            st.json(get_client().get_stats())
+        
+        with st.expander("📉 ipinfo.io Quota"):
+            quota_stats = get_scheduler().get_stats()
+            st.progress(
+                min(quota_stats['used'] / quota_stats['monthly_quota'], 1.0) if quota_stats['monthly_quota'] else 1.0,
+                text=f"{quota_stats['used']:,} of {quota_stats['monthly_quota']:,} requests used in {quota_stats['period']}"
+            )
+            st.json(quota_stats)
+        
+        with st.expander("💾 Search History Writer"):
+            st.json(get_writer().get_stats())
+        
+        with st.expander("🗄️ History Archive"):
+            st.caption("Rows older than the retention age are moved to Parquet by `python archive.py run`; totals above include them.")
+            st.json(load_archive_stats(get_data_version()))
+        
+        st.markdown("---")
+        render_metrics_panel()
+    
+    else:
+        st.error("Could not load analytics data.")
+
+
+def main():
+    # Initialize database
+    init_database()
+    
+    st.title("Network Tracker: Phone Number & IP Address Intelligence")
+    st.subheader("Built using Python and Streamlit")
+    
+    # Privacy notice
+    st.info("🔒 **Privacy Notice:** This app automatically detects your IP address to provide accurate geolocation services. Search history is stored locally for analytics. No personal information is shared with third parties.")
+    
+    # Create tabs for different tracking types
+    # Only the selected tab's content runs; the others cost nothing on a rerun
+    tab2, tab1, tab3 = st.tabs(
+        ["🌐 IP Address Intelligence", "📱 Phone Number Intelligence", "📊 Analytics & History"],
+        key="main_tabs",
+        on_change="rerun"
+    )
+    
+    with tab2:
+        if tab2.open:
+            with timed('render.ip_tab'):
+                render_ip_tab()
+    
+    with tab1:
+        if tab1.open:
+            with timed('render.phone_tab'):
+                render_phone_tab()
+    
+    with tab3:
+        if tab3.open:
+            with timed('render.analytics_tab'):
+                render_analytics_tab()
     
     # Footer
     st.markdown("---")
     st.markdown("**Note:** IP tracking uses ipinfo.io free tier (50,000 requests/month). Real IP detection uses ipify.org. Both services are reliable and privacy-focused. Search history is stored locally using SQLite.")
+    
+    # Load the other tabs' dependencies in the background now that the page is up
+    startup.mark('first render')
+    startup.start_warmup()
 
 
 if __name__ == "__main__":